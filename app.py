@@ -1,23 +1,45 @@
 from flask import Flask, request, jsonify, redirect, session
 from database import Database
-from email.mime.text import MIMEText
 from flask_cors import CORS
 import csv
+import gzip
+import io
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from google_auth_httplib2 import AuthorizedHttp
+from google.auth.exceptions import TransportError
+import httplib2
+import requests
+import http.client
+import socket
 import base64
+import fcntl
 import os
 import time
-from datetime import datetime
+import threading
+from itertools import islice
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta, timezone
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.date import DateTrigger
 from oauthlib.oauth2 import WebApplicationClient
 import json
-import requests
+import pandas as pd
+from http_client import graph_session
+from templating import compile_template, field_name
+from message_builder import create_message, MessageSkeleton
+from rate_limit import get_limiter, parse_retry_after, RATE_LIMIT_RETRIES, PROVIDER_DAILY_QUOTAS
 
 app = Flask(__name__)
 CORS(app)
 
+# Largest accepted request body; bigger uploads are rejected with 413
+app.config["MAX_CONTENT_LENGTH"] = int(os.environ.get("MAX_UPLOAD_BYTES", 200 * 1024 * 1024))
+
 # os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
 
 db = Database()
@@ -40,6 +62,64 @@ OUTLOOK_SCOPES = [
     "offline_access",
 ]
 OUTLOOK_REDIRECT_URI = "https://mass-mailer.onrender.com/outlook_callback"
+# API locations; overridable so benchmarks can run against local stand-in servers
+GRAPH_API_URL = os.environ.get("GRAPH_API_URL", "https://graph.microsoft.com/v1.0")
+OUTLOOK_TOKEN_URL = os.environ.get("OUTLOOK_TOKEN_URL", "https://login.microsoftonline.com/common/oauth2/v2.0/token")
+GMAIL_API_ENDPOINT = os.environ.get("GMAIL_API_ENDPOINT")  # Root URL replacing https://gmail.googleapis.com/
+
+# Maximum number of in-flight API calls per sender mailbox
+GMAIL_MAX_IN_FLIGHT = int(os.environ.get("GMAIL_MAX_IN_FLIGHT", 8))
+OUTLOOK_MAX_IN_FLIGHT = int(os.environ.get("OUTLOOK_MAX_IN_FLIGHT", 8))  # Keep at or below GRAPH_POOL_SIZE
+
+# Gmail transport: "single" makes one HTTP round trip per call, "batch" groups calls into multipart batch requests
+GMAIL_TRANSPORT = os.environ.get("GMAIL_TRANSPORT", "single")
+# Gmail accepts up to 100 calls per batch, but send batches above 50 are often rate limited
+GMAIL_BATCH_SIZE = min(int(os.environ.get("GMAIL_BATCH_SIZE", 50)), 100)
+GMAIL_BATCH_RETRIES = int(os.environ.get("GMAIL_BATCH_RETRIES", 3))  # Retries for failed sub-requests only
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+# Transport failures that may succeed on a retry; anything else, such as a revoked refresh token, is permanent
+TRANSIENT_ERRORS = (
+    ConnectionError, TimeoutError, socket.timeout, http.client.HTTPException, httplib2.ServerNotFoundError, TransportError,
+    requests.ConnectionError, requests.Timeout
+)
+GMAIL_STATUS_COST = 0.05  # messages.get costs 5 quota units against 100 for messages.send
+
+# Outlook transport: "single" posts one sendMail per recipient, "batch" packs them into Graph $batch envelopes
+OUTLOOK_TRANSPORT = os.environ.get("OUTLOOK_TRANSPORT", "single")
+GRAPH_BATCH_SIZE = min(int(os.environ.get("GRAPH_BATCH_SIZE", 20)), 20)  # Graph allows at most 20 requests per $batch
+GRAPH_BATCH_RETRIES = int(os.environ.get("GRAPH_BATCH_RETRIES", 3))  # Retries for failed sub-requests only
+OUTLOOK_TOKEN_REFRESH_MARGIN = int(os.environ.get("OUTLOOK_TOKEN_REFRESH_MARGIN", 300))  # Refresh this many seconds before expiry
+
+# Gmail API clients per mailbox: {"service", "credentials", "refresh_token", "saved_token"}
+gmail_clients = {}
+gmail_clients_lock = threading.Lock()
+gmail_http = threading.local()
+
+# In-process Outlook access tokens per mailbox: {"access_token", "expires_at"}
+outlook_tokens = {}
+outlook_token_locks = {}
+outlook_token_locks_guard = threading.Lock()
+
+# Recipient clean-up: rows are validated in vectorised chunks of this size
+RECIPIENT_CHUNK_SIZE = int(os.environ.get("RECIPIENT_CHUNK_SIZE", 50000))
+EMAIL_PATTERN = r"^[a-z0-9!#$%&'*+/=?^_`{|}~.-]+@[a-z0-9-]+(\.[a-z0-9-]+)*\.[a-z]{2,}$"
+
+# Outbox workers claim this many recipients at a time
+OUTBOX_CHUNK_SIZE = int(os.environ.get("OUTBOX_CHUNK_SIZE", 200))
+# Seconds a claimed chunk may take before another process treats its worker as dead and requeues it
+OUTBOX_LEASE_SECONDS = int(os.environ.get("OUTBOX_LEASE_SECONDS", 900))
+
+# List endpoints return this many rows per page unless ?limit asks for more, up to MAX_PAGE_SIZE
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Time range /stats/timeseries covers when none is given
+TIMESERIES_DEFAULT_RANGE = {"hour": timedelta(hours=48), "day": timedelta(days=30)}
+
+# Background delivery status reconciliation
+RECONCILE_INTERVAL = int(os.environ.get("RECONCILE_INTERVAL", 30))  # Seconds between runs
+RECONCILE_BATCH_SIZE = int(os.environ.get("RECONCILE_BATCH_SIZE", 500))  # Pending rows checked per run
+RECONCILE_MAX_ATTEMPTS = int(os.environ.get("RECONCILE_MAX_ATTEMPTS", 5))  # Checks before a row is marked UNKNOWN
 
 # Scheduler Setup (Using APScheduler for scheduling email sending)
 scheduler = BackgroundScheduler()
@@ -121,6 +201,8 @@ def callback():
 
     # Store credentials in the database
     db.store_credentials_for_gmail(user_email, credentials, "enabled", 0)
+    with gmail_clients_lock:
+        gmail_clients.pop(user_email, None)
 
     return redirect(f'http://localhost:8501/?page=send_mass_mail')
 
@@ -150,7 +232,7 @@ def outlook_callback():
         "redirect_uri": OUTLOOK_REDIRECT_URI,
     }
     
-    token_response = requests.post(token_uri, data=token_request_body)
+    token_response = graph_session.post(token_uri, data=token_request_body)
     token_response_data = token_response.json()
 
     if "access_token" not in token_response_data:
@@ -160,7 +242,7 @@ def outlook_callback():
     access_token = token_response_data["access_token"]
     headers = {"Authorization": f"Bearer {access_token}"}
     
-    user_info_response = requests.get("https://graph.microsoft.com/v1.0/me", headers=headers)
+    user_info_response = graph_session.get(f"{GRAPH_API_URL}/me", headers=headers)
     user_info = user_info_response.json()
     
     user_email = user_info.get("userPrincipalName", "Unknown")
@@ -169,6 +251,7 @@ def outlook_callback():
     
     # Store credentials in the database
     db.store_credentials_for_outlook(user_email, token_response_data['access_token'], token_response_data['refresh_token'], client_id, client_secret, scopes, "enabled", 0)
+    outlook_tokens.pop(user_email, None)  # Drop any token cached for the previous grant
 
     return redirect(f"http://localhost:8501/?page=send_mass_mail")
 
@@ -183,6 +266,9 @@ def send_mass_mail():
     send_time = request.form.get("send_time")  # Add schedule time (optional)
     cc = request.form.get("cc", "")
     bcc = request.form.get("bcc", "")
+    template_id = request.form.get("template_id", type=int)  # Template the subject and body came from (optional)
+    # Optional comma-separated mailboxes to shard the campaign over
+    sender_pool = [email.strip() for email in request.form.get("sender_pool", "").split(",") if email.strip()]
 
     # Parse send_time (if provided)
     schedule_time = None
@@ -192,170 +278,870 @@ def send_mass_mail():
         except ValueError:
             return jsonify({"error": "Invalid date format. Please use 'YYYY-MM-DD HH:MM:SS'."}), 400
 
-    recipients = []
-    if csv_file:
-        try:
-            csv_file.seek(0)  # Reset file pointer to the beginning
-            csv_reader = csv.reader(csv_file.read().decode("utf-8").splitlines())  # Decode binary to text and split into lines
-            for row in csv_reader:
-                if row:  # Ensure the row is not empty
-                    recipients.append(row[0])  # Assuming emails are in the first column
-        except Exception as e:
-            return jsonify({"error": f"Error processing CSV file: {e}"}), 400
+    # Recipients are parsed and cleaned lazily while they are written to the outbox
+    recipient_summary = {"total": 0, "invalid": 0, "duplicates": 0, "in_cc_bcc": 0, "accepted": 0}
+    recipients = clean_recipients(iter_csv_recipients(csv_file) if csv_file else [], cc, bcc, recipient_summary)
+
+    if email_service not in ("Gmail", "Outlook"):
+        return jsonify({"error": "Invalid email service selected"}), 400
+
+    if sender_pool:
+        pool = db.get_mailbox_pool(email_service.lower(), sender_pool)
+        if not pool:
+            return jsonify({"error": "No enabled mailbox in the sender pool"}), 400
+        sender_email = sender_email or pool[0]["email"]
+        assigned = shard_recipients(recipients, pool, email_service.lower())
+    else:
+        # The send runs in the background, so a mailbox that cannot send is reported now
+        if not db.get_mailbox_pool(email_service.lower(), [sender_email]):
+            return jsonify({"error": "User not Authenticated or Email Disabled"}), 403
+        assigned = ((recipient, sender_email) for recipient in recipients)
+    outbox_rows = ((email, sender, fields) for (email, fields), sender in assigned)
 
     try:
-        if email_service == "Gmail":
-            if schedule_time:
-                # Schedule email sending
-                scheduler.add_job(
-                    send_gmail,
-                    DateTrigger(run_date=schedule_time),
-                    args=[sender_email, recipients, subject, body, cc, bcc],
-                    id=f"email_{sender_email}_{time.time()}"
-                )
-                return jsonify({"message": f"Email scheduled for {schedule_time}"}), 202
-            else:
-                # Send email immediately
-                mail_response, mail_response_code = send_gmail(sender_email, recipients, subject, body, cc, bcc)
-        elif email_service == "Outlook":
-            if schedule_time:
-                # Schedule email sending
-                scheduler.add_job(
-                    send_outlook,
-                    DateTrigger(run_date=schedule_time),
-                    args=[sender_email, recipients, subject, body, cc, bcc],
-                    id=f"email_{sender_email}_{time.time()}"
-                )
-                return jsonify({"message": f"Email scheduled for {schedule_time}"}), 202
-            else:
-                # Send email immediately
-                mail_response, mail_response_code = send_outlook(sender_email, recipients, subject, body, cc, bcc)
-        else:
-            return jsonify({"error": "Invalid email service selected"}), 400
+        # Queue every recipient in the outbox first, so a restart can resume the campaign
+        campaign_id = db.create_campaign(sender_email, email_service.lower(), subject, body, cc, bcc, send_time or None, outbox_rows, template_id)
+        # Duplicates spread across chunks are dropped by the outbox's unique key
+        queued = db.get_campaign(campaign_id)["recipient_count"]
+        recipient_summary["duplicates"] += recipient_summary["accepted"] - queued
+        recipient_summary["accepted"] = queued
+        response = {"campaign_id": campaign_id, "status_url": f"/campaigns/{campaign_id}", "recipients": recipient_summary}
+        if schedule_time:
+            # Schedule email sending
+            schedule_campaign(campaign_id, schedule_time)
+            return jsonify({"message": f"Email scheduled for {schedule_time}", "state": "scheduled", **response}), 202
 
-        return jsonify(mail_response), mail_response_code
+        # Send email immediately, on a scheduler thread; progress is reported by /campaigns/<id>
+        schedule_campaign(campaign_id, datetime.now())
+        return jsonify({"message": "Campaign started", "state": "running", **response}), 202
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"Error sending emails: {e}"}), 500
 
+# Raw reader over an upload stream. Werkzeug spools uploads to a SpooledTemporaryFile, which has no
+# readable() before Python 3.11, so it cannot be handed to io.TextIOWrapper or io.BufferedReader directly.
+class UploadReader(io.RawIOBase):
+    def __init__(self, stream):
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+# Stream (email, merge fields) pairs out of an uploaded CSV (optionally gzip-compressed) one row at a time.
+# Werkzeug already spools large uploads to a temporary file, so the upload is never held in memory whole.
+# When the first row is a header (its first cell is not an address), the other columns become merge fields
+# named after their header, serialised as JSON; otherwise the fields are None.
+def iter_csv_recipients(csv_file):
+    csv_file.stream.seek(0)  # Reset file pointer to the beginning
+    stream = io.BufferedReader(UploadReader(csv_file.stream))
+    if stream.peek(2)[:2] == b"\x1f\x8b":  # gzip magic number
+        stream = gzip.GzipFile(fileobj=stream)
+    try:
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        header = None
+        first = True
+        for row in csv.reader(text):
+            if not row:  # Ensure the row is not empty
+                continue
+            if first:
+                first = False
+                if "@" not in row[0]:
+                    header = [field_name(cell) for cell in row]
+                    continue
+            fields = None
+            if header and len(row) > 1:
+                fields = json.dumps(dict(zip(header[1:], row[1:])))
+            yield row[0], fields  # Assuming emails are in the first column
+    except (UnicodeDecodeError, csv.Error, OSError, EOFError) as e:
+        raise ValueError(f"Error processing CSV file: {e}")
+
+# Lowercase, trim, validate and de-duplicate (email, fields) pairs in vectorised chunks, dropping addresses
+# already in cc/bcc. Rejections are counted in summary; accepted pairs are yielded.
+def clean_recipients(recipients, cc, bcc, summary):
+    copied = {email.strip().lower() for email in f"{cc},{bcc}".split(",") if email.strip()}
+    for chunk in chunked(recipients, RECIPIENT_CHUNK_SIZE):
+        addresses, fields = zip(*chunk)
+        emails = pd.Series(addresses, dtype="object").str.strip().str.lower()
+        valid = emails.str.match(EMAIL_PATTERN, na=False)
+        in_cc_bcc = valid & emails.isin(copied)
+        duplicate = valid & ~in_cc_bcc & emails.duplicated()
+        accepted = valid & ~in_cc_bcc & ~duplicate
+
+        summary["total"] += len(emails)
+        summary["invalid"] += int((~valid).sum())
+        summary["in_cc_bcc"] += int(in_cc_bcc.sum())
+        summary["duplicates"] += int(duplicate.sum())
+        summary["accepted"] += int(accepted.sum())
+        yield from zip(emails[accepted].tolist(), pd.Series(fields, dtype="object")[accepted].tolist())
+
+# Progress of a campaign: outbox counts overall and per mailbox, send rate, ETA and the last error
+@app.route("/campaigns/<int:campaign_id>", methods=["GET"])
+def campaign_status(campaign_id):
+    try:
+        campaign = db.get_campaign(campaign_id)
+        if not campaign:
+            return jsonify({"error": "Campaign not found"}), 404
+        by_sender = db.get_outbox_counts_by_sender(campaign_id)
+        counts = {}
+        for sender_counts in by_sender.values():
+            for state, count in sender_counts.items():
+                counts[state] = counts.get(state, 0) + count
+        total = sum(counts.values())
+        done = counts.get("sent", 0) + counts.get("failed", 0)
+
+        # Rate over the time the campaign has been running so far, or ran in total once finished
+        rate = eta = None
+        if campaign["started_at"]:
+            started = datetime.strptime(campaign["started_at"], "%Y-%m-%d %H:%M:%S")
+            ended = datetime.strptime(campaign["finished_at"], "%Y-%m-%d %H:%M:%S") if campaign["finished_at"] else datetime.utcnow()
+            elapsed = (ended - started).total_seconds()
+            if elapsed > 0 and done:
+                rate = done / elapsed
+                if campaign["state"] not in ("completed", "failed"):
+                    eta = (total - done) / rate
+
+        return jsonify({
+            "campaign_id": campaign_id,
+            "state": campaign["state"],
+            "service": campaign["service"],
+            "sender_email": campaign["sender_email"],
+            "subject": campaign["subject"],
+            "template_id": campaign["template_id"],
+            "send_time": campaign["send_time"],
+            "created_at": campaign["created_at"],
+            "started_at": campaign["started_at"],
+            "finished_at": campaign["finished_at"],
+            "total": total,
+            "counts": counts,
+            "progress": done / total * 100 if total else 100,
+            "rate_per_second": rate,
+            "eta_seconds": eta,
+            "errors": {"failed": counts.get("failed", 0), "last_error": campaign["last_error"]},
+            "round_trips": campaign["round_trips"],
+            "round_trips_saved": campaign["round_trips_saved"],
+            "senders": by_sender,
+            # Delivery statuses of this campaign's mails, updated by reconcile_email_statuses
+            "delivery": db.get_campaign_delivery_counts(campaign_id)
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Campaigns, newest first, optionally filtered by state, service or sender
+@app.route("/campaigns", methods=["GET"])
+def list_campaigns():
+    try:
+        return jsonify(paginate(lambda after, limit: db.get_campaigns_page(
+            request.args.get("state"), request.args.get("service"), request.args.get("sender"), after, limit
+        ))), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Recipients of one campaign with their queue state and delivery status
+@app.route("/campaigns/<int:campaign_id>/recipients", methods=["GET"])
+def campaign_recipients(campaign_id):
+    try:
+        if not db.get_campaign(campaign_id):
+            return jsonify({"error": "Campaign not found"}), 404
+        return jsonify(paginate(lambda after, limit: db.get_campaign_recipients_page(
+            campaign_id, request.args.get("state"), after, limit
+        ))), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Run a campaign on the scheduler at its send time
+def schedule_campaign(campaign_id, run_date):
+    scheduler.add_job(
+        run_campaign,
+        DateTrigger(run_date=max(run_date, datetime.now())),
+        args=[campaign_id],
+        id=f"campaign_{campaign_id}",
+        replace_existing=True
+    )
+
+# Outbox worker: send every mailbox's shard of a campaign in parallel and checkpoint each outcome.
+# A process that stops part way leaves the rest queued, and resume_campaigns picks them up again.
+def run_campaign(campaign_id):
+    campaign = db.get_campaign(campaign_id)
+    if not campaign:
+        return {"error": "Campaign not found"}, 404
+    db.set_campaign_state(campaign_id, "running")
+    senders = db.get_campaign_senders(campaign_id)
+
+    if len(senders) > 1:
+        with ThreadPoolExecutor(max_workers=len(senders)) as executor:
+            shards = list(executor.map(lambda sender: run_campaign_shard(campaign, sender), senders))
+    else:
+        shards = [run_campaign_shard(campaign, sender) for sender in senders]
+
+    totals = {"round_trips": 0, "round_trips_saved": 0}
+    for response, code in shards:
+        for key in totals:
+            totals[key] += response.get(key, 0)
+    by_sender = {sender: response for sender, (response, _) in zip(senders, shards)}
+
+    pauses = [response["resume_in"] for response, code in shards if code == 202]
+    if pauses:
+        # A shard was throttled: resume once the shortest pause is over; finished shards have nothing left to claim
+        schedule_campaign(campaign_id, datetime.now() + timedelta(seconds=min(pauses)))
+        return {"message": "Campaign throttled, resuming later", "campaign_id": campaign_id, "senders": by_sender, **totals}, 202
+
+    failed = [(response, code) for response, code in shards if code != 200]
+    if failed:
+        response, code = failed[0]
+        db.set_campaign_state(campaign_id, "failed", response.get("error") or response.get("message"))
+        response = {**response, "campaign_id": campaign_id, "senders": by_sender}
+        return response, code
+
+    db.set_campaign_state(campaign_id, "completed")
+    return {
+        "message": "Email sent successfully!",
+        "campaign_id": campaign_id,
+        "counts": db.get_outbox_counts(campaign_id),
+        "senders": by_sender,
+        **totals
+    }, 200
+
+# Claim one mailbox's queued recipients in chunks and send them from that mailbox
+def run_campaign_shard(campaign, sender_email):
+    campaign_id = campaign["id"]
+    send = send_gmail if campaign["service"] == "gmail" else send_outlook
+
+    totals = {"round_trips": 0, "round_trips_saved": 0}
+    while True:
+        rows = db.claim_outbox_rows(campaign_id, sender_email, OUTBOX_CHUNK_SIZE)
+        if not rows:
+            break
+        outbox_ids = {recipient: outbox_id for outbox_id, recipient, _ in rows}
+        merge_fields = {recipient: json.loads(fields) for _, recipient, fields in rows if fields}
+
+        # Checkpoints are written in the same transaction as the recipient's status row.
+        # Throttled recipients go back in the queue and are claimed again once the mailbox has slowed down.
+        outcomes = {}
+        with db.status_writer(campaign_id=campaign_id) as writer:
+            def checkpoint(recipient, message_id, status):
+                state = {"FAILED": "failed", "THROTTLED": "queued"}.get(status, "sent")
+                outcomes[state] = outcomes.get(state, 0) + 1
+                if status == "THROTTLED":
+                    writer.add_outbox_update(state, outbox_ids[recipient])
+                else:
+                    writer.add(recipient, campaign["service"], message_id, status, sender_email, outbox_update=(state, outbox_ids[recipient]))
+
+            response, code = send(
+                sender_email, list(outbox_ids), campaign["subject"], campaign["body"],
+                campaign["cc"], campaign["bcc"], on_result=checkpoint, status_writer=writer, fields=merge_fields
+            )
+        if code != 200:
+            # Nothing more can be sent with this mailbox. The chunk's unsent rows go back in the queue, but the
+            # campaign is marked failed and is not retried on its own; it resumes only if run again.
+            db.release_outbox_rows(outbox_ids.values())
+            return response, code
+        for key in totals:
+            totals[key] += response.get(key, 0)
+        # The campaign runs as a scheduler job, so its totals are kept on its row for GET /campaigns/<id>
+        db.add_campaign_round_trips(campaign_id, response.get("round_trips", 0), response.get("round_trips_saved", 0))
+        if outcomes and set(outcomes) == {"queued"}:
+            # The whole chunk was throttled: hand the thread back until the mailbox's pause is over
+            pause = get_limiter(campaign["service"], sender_email).pause_remaining()
+            return {"message": "Mailbox throttled", "resume_in": pause, **totals}, 202
+
+    return {"message": "Email sent successfully!", **totals}, 200
+
+# Spread recipients over a pool of mailboxes, yielding (recipient, sender_email) pairs.
+# A recipient may be any item, such as an (email, fields) pair.
+# Each mailbox is weighted by its remaining daily quota and by its delivery rate, the delivery score over
+# the mails it has sent (both plus one, so a new mailbox starts at full rate). Smooth weighted round-robin
+# interleaves the mailboxes, and one that reaches its quota leaves the rotation while others have room.
+def shard_recipients(recipients, pool, service):
+    quota = PROVIDER_DAILY_QUOTAS[service]
+    remaining = {mailbox["email"]: max(quota - mailbox["sent_today"], 0) for mailbox in pool}
+    rates = {mailbox["email"]: min((mailbox["delivery_score"] + 1) / (mailbox["sent_total"] + 1), 1) for mailbox in pool}
+    current = {email: 0.0 for email in remaining}
+
+    for recipient in recipients:
+        active = [email for email in remaining if remaining[email] > 0] or list(remaining)
+        weights = {email: rates[email] * max(remaining[email], 1) for email in active}
+        total = sum(weights.values())
+        for email in active:
+            current[email] += weights[email]
+        sender = max(active, key=current.get)
+        current[sender] -= total
+        remaining[sender] -= 1
+        yield recipient, sender
+
+# Pick up campaigns left unfinished by a previous process. Every worker process imports this module, so
+# only the one holding the resume lock does it; the lock is held for the life of the process and passes
+# to a new worker once the holder exits.
+def resume_campaigns():
+    if not acquire_resume_lock():
+        return
+    db.requeue_stale_outbox_rows(OUTBOX_LEASE_SECONDS)
+    for campaign in db.get_unfinished_campaigns():
+        if campaign["state"] == "scheduled" and campaign["send_time"]:
+            schedule_campaign(campaign["id"], datetime.strptime(campaign["send_time"], "%Y-%m-%d %H:%M:%S"))
+        else:
+            schedule_campaign(campaign["id"], datetime.now())
+
+resume_lock_file = None
+
+def acquire_resume_lock():
+    global resume_lock_file
+    if resume_lock_file:
+        return True
+    lock_file = open(f"{db.db_name}.resume.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    resume_lock_file = lock_file
+    return True
+
+# Render compiled (subject, body) templates for one recipient; fields maps recipients to their merge values
+def personalise(templates, recipient, fields=None):
+    values = {"email": recipient}
+    if fields and recipient in fields:
+        values.update(fields[recipient])
+    return tuple(template.render(values) for template in templates)
+
 # For send email via Gmail API
-def send_gmail(sender_email, recipients, subject, body, cc="", bcc=""):
-    final, credentials = db.get_credentials_from_db_for_gmail(sender_email)
+def send_gmail(sender_email, recipients, subject, body, cc="", bcc="", max_in_flight=None, transport=None, on_result=None, status_writer=None, fields=None):
+    service = get_gmail_service(sender_email)
     
-    if not credentials:
+    if not service:
         return {"message": "User not Authenticated or Email Disabled"}, 403
     
-    try:
-        service = build("gmail", "v1", credentials=credentials)
-        for i in range(len(recipients)):
-            message = create_message("me", recipients[i], subject, body, cc, bcc)
+    max_in_flight = max_in_flight or GMAIL_MAX_IN_FLIGHT
+    limiter = get_limiter("gmail", sender_email)
+    templates = compile_template(subject), compile_template(body)
+    # Without merge fields every recipient gets the same message, so it is serialised once
+    skeleton = None if any(template.fields for template in templates) else MessageSkeleton("me", subject, body, cc, bcc)
+
+    def send_request(service, recipient):
+        if skeleton:
+            message = skeleton.create_message(recipient)
+        else:
+            message = create_message("me", recipient, *personalise(templates, recipient, fields), cc, bcc)
+        return service.users().messages().send(userId="me", body=message)
+
+    def send_one(recipient):
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            limiter.acquire()
             try:
                 # Attempt to send the email
-                sent_message = service.users().messages().send(userId="me", body=message).execute()
-                message_id = sent_message.get("id")  # Extract the message ID
+                sent_message = send_request(service, recipient).execute()
+                limiter.success()
+                # Resolved later by reconcile_email_statuses
+                return [(recipient, sent_message.get("id"), "PENDING")], attempt + 1, attempt + 1
+            except Exception as e:
+                if not is_retryable(e):
+                    # Log 'Failed' status if there's an error
+                    return [(recipient, None, "FAILED")], attempt + 1, attempt + 1
+                error = e
+                # Throttling, server errors and dropped connections all back the sender off with jitter
+                limiter.throttle(parse_retry_after(e.resp) if isinstance(e, HttpError) else None)
+        return [(recipient, None, "THROTTLED" if is_throttled(error) else "FAILED")], attempt + 1, attempt + 1
 
-                # Poll Gmail API to check for delivery status
-                status = poll_email_status(service, message_id)
-                if status == "DELIVERED":
-                    final+=1
-                db.insert_email_status(recipients[i], "gmail", message_id, status)  # Update status in the database
+    def send_batch(chunk):
+        results, round_trips, calls = execute_gmail_batch(service, chunk, send_request, limiter)
+        return [
+            (recipient, response.get("id"), "PENDING") if exception is None
+            else (recipient, None, "THROTTLED" if is_throttled(exception) else "FAILED")
+            for recipient, response, exception in results
+        ], round_trips, calls
 
-            except Exception as e:
-                # Log 'Failed' status if there's an error
-                db.insert_email_status(recipients[i], "gmail", None, "FAILED")
-        db.put_delivery_score(sender_email, final)
-        return {"message": "Email sent successfully!"}, 200
+    try:
+        if (transport or GMAIL_TRANSPORT) == "batch":
+            jobs = run_bounded(send_batch, chunked(recipients, GMAIL_BATCH_SIZE), max_in_flight)
+        else:
+            jobs = run_bounded(send_one, recipients, max_in_flight)
+
+        total_round_trips = total_calls = 0
+        with status_writer or db.status_writer() as writer:
+            for results, round_trips, calls in jobs:
+                total_round_trips += round_trips
+                total_calls += calls
+                for recipient, message_id, status in results:
+                    # A caller taking results writes the status row itself, together with its own checkpoint
+                    if on_result:
+                        on_result(recipient, message_id, status)
+                    else:
+                        writer.add(recipient, "gmail", message_id, status, sender_email)  # Update status in the database
+        return {
+            "message": "Email sent successfully!",
+            "round_trips": total_round_trips,
+            "round_trips_saved": total_calls - total_round_trips
+        }, 200
     
     except Exception as e:
         return {"message": f"Failed to send email: {str(e)}"}, 400
+    finally:
+        save_gmail_credentials(sender_email)
 
-# Poll Gmail API to get the delivery status of an email.
-def poll_email_status(service, message_id, max_attempts=5, delay=5):
-    for attempt in range(max_attempts):
+# Run request_for(service, item) for every item of one chunk as a single Gmail batch request.
+# Sub-requests that fail with a retryable error are retried on their own; the rest are returned as they are.
+# With a limiter, every attempt first takes cost tokens per sub-request and throttled sub-requests slow it down.
+# Returns ([(item, response, exception)], round_trips, calls).
+def execute_gmail_batch(service, items, request_for, limiter=None, cost=1):
+    pending = {str(index): item for index, item in enumerate(items)}
+    results = []
+    round_trips = calls = 0
+    for attempt in range(GMAIL_BATCH_RETRIES + 1):
+        responses = {}
+
+        def callback(request_id, response, exception):
+            responses[request_id] = (response, exception)
+
+        if limiter:
+            limiter.acquire(len(pending) * cost)
+        batch = service.new_batch_http_request(callback=callback)
+        for request_id, item in pending.items():
+            batch.add(request_for(service, item), request_id=request_id)
         try:
-            message = service.users().messages().get(userId="me", id=message_id).execute()
-            label_ids = message.get("labelIds", [])
-            if "SENT" in label_ids:
-                return "DELIVERED"
-            elif "INBOX" in label_ids:
-                return "INBOXED"
-            elif "SPAM" in label_ids:
-                return "SPAMMED"
+            batch.execute()
         except Exception as e:
-            print(f"Error polling message status: {e}")
-        time.sleep(delay)  # Wait before the next attempt
-    return "UNKNOWN"
-
-# Create Message for Gmail
-def create_message(sender, to, subject, body, cc="", bcc=""):
-    message = MIMEText(body)
-    message["to"] = to
-    message["from"] = sender
-    message["subject"] = subject
-    if cc:
-        message["cc"] = cc
-    if bcc:
-        message["bcc"] = bcc
-    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode("utf-8")
-    return {"raw": raw_message}
+            # The whole batch failed, so every sub-request gets the same error
+            responses = {request_id: (None, e) for request_id in pending}
+        round_trips += 1
+        calls += len(pending)
+
+        retry = {}
+        throttled = False
+        delay = None
+        for request_id, item in pending.items():
+            response, exception = responses.get(request_id, (None, ConnectionError("Missing batch response")))
+            if exception is not None and is_throttled(exception):
+                throttled = True
+                seconds = parse_retry_after(exception.resp)
+                if seconds is not None:
+                    delay = max(delay or 0, seconds)
+            if exception is not None and attempt < GMAIL_BATCH_RETRIES and is_retryable(exception):
+                retry[request_id] = item
+            else:
+                results.append((item, response, exception))
+        if limiter:
+            if throttled:
+                limiter.throttle(delay)
+            elif len(pending) > len(retry):
+                limiter.success(len(pending) - len(retry))
+        if not retry:
+            break
+        pending = retry
+        if not (limiter and throttled):
+            time.sleep(2 ** attempt)
+    return results, round_trips, calls
+
+# Errors worth retrying: throttling, server errors and transient transport failures
+def is_retryable(exception):
+    if isinstance(exception, HttpError):
+        return exception.resp.status in RETRYABLE_STATUS_CODES or is_throttled(exception)
+    return isinstance(exception, TRANSIENT_ERRORS)
+
+# Gmail signals throttling with 429, or with 403 and a rateLimitExceeded / userRateLimitExceeded reason
+def is_throttled(exception):
+    if not isinstance(exception, HttpError):
+        return False
+    if exception.resp.status == 429:
+        return True
+    return exception.resp.status == 403 and b"ratelimitexceeded" in (exception.content or b"").lower()
+
+# Split an iterable into lists of at most size items
+def chunked(items, size):
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+# Get the cached Gmail client for a mailbox, building it from the static discovery document on first use.
+# The client is rebuilt when the mailbox is re-verified and dropped when it is disabled.
+def get_gmail_service(sender_email):
+    _, credentials = db.get_credentials_from_db_for_gmail(sender_email)
+    with gmail_clients_lock:
+        if not credentials:
+            gmail_clients.pop(sender_email, None)
+            return None
+        client = gmail_clients.get(sender_email)
+        if client and client["refresh_token"] == credentials.refresh_token:
+            return client["service"]
+
+    service = build_from_document(gmail_discovery_document(), credentials=credentials, requestBuilder=build_gmail_request)
+    with gmail_clients_lock:
+        gmail_clients[sender_email] = {
+            "service": service,
+            "credentials": credentials,
+            "refresh_token": credentials.refresh_token,
+            "saved_token": credentials.token
+        }
+    return service
+
+# The Gmail discovery document bundled with the client library, read once.
+# Its rootUrl also sets the batch endpoint, which client_options.api_endpoint would leave pointing at Google.
+@lru_cache(maxsize=1)
+def gmail_discovery_document():
+    document = json.loads(get_static_doc("gmail", "v1"))
+    if GMAIL_API_ENDPOINT:
+        document["rootUrl"] = GMAIL_API_ENDPOINT.rstrip("/") + "/"
+    return json.dumps(document)
+
+# httplib2 connections are not thread-safe, so every request runs on its thread's own connection.
+# That lets one cached client be shared by all workers while each thread keeps its connection alive.
+def build_gmail_request(http, *args, **kwargs):
+    if not hasattr(gmail_http, "http"):
+        gmail_http.http = httplib2.Http()
+    return HttpRequest(AuthorizedHttp(http.credentials, http=gmail_http.http), *args, **kwargs)
+
+# Write a token the client library refreshed during a send back to the database
+def save_gmail_credentials(sender_email):
+    with gmail_clients_lock:
+        client = gmail_clients.get(sender_email)
+        if not client or client["credentials"].token == client["saved_token"]:
+            return
+        credentials = client["credentials"]
+        client["saved_token"] = credentials.token
+    db.update_tokens_for_gmail(sender_email, credentials.token, credentials.refresh_token, credentials.expiry)
+
+# Run func over items on a thread pool, keeping at most max_in_flight calls pending.
+# Results are yielded in completion order so the caller can do its bookkeeping on one thread.
+def run_bounded(func, items, max_in_flight):
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        pending = set()
+        for item in items:
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(func, item))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+# Map Gmail label ids to a delivery status. None means the message is not resolved yet.
+def status_from_labels(label_ids):
+    if "SENT" in label_ids:
+        return "DELIVERED"
+    elif "INBOX" in label_ids:
+        return "INBOXED"
+    elif "SPAM" in label_ids:
+        return "SPAMMED"
+    return None
+
+# Look up the current delivery status of a sent Gmail message once.
+def get_email_status(service, message_id):
+    try:
+        message = status_request(service, message_id).execute()
+        return status_from_labels(message.get("labelIds", []))
+    except Exception as e:
+        print(f"Error polling message status: {e}")
+        return None
+
+# messages.get request returning only the labels needed to work out a status
+def status_request(service, message_id):
+    return service.users().messages().get(userId="me", id=message_id, format="minimal")
+
+# Resolve PENDING Gmail rows in bulk, outside of the send path.
+# Runs periodically on the scheduler; rows still unresolved after RECONCILE_MAX_ATTEMPTS become UNKNOWN.
+def reconcile_email_statuses(batch_size=RECONCILE_BATCH_SIZE, transport=None):
+    pending_by_sender = {}
+    for row in db.get_pending_email_statuses("gmail", batch_size):
+        pending_by_sender.setdefault(row["sender"], []).append(row)
+
+    for sender_email, rows in pending_by_sender.items():
+        service = get_gmail_service(sender_email)
+        if not service:
+            # Disabled since the rows were read; count the run as an attempt so the rows cannot stay at the head
+            db.update_email_statuses([
+                ("UNKNOWN" if row["attempts"] + 1 >= RECONCILE_MAX_ATTEMPTS else "PENDING", row["id"]) for row in rows
+            ])
+            continue
+        # Status checks draw on the same per-user quota as sends
+        limiter = get_limiter("gmail", sender_email)
+
+        def check_one(row):
+            limiter.acquire(GMAIL_STATUS_COST)
+            return [(row, get_email_status(service, row["message_id"]))]
+
+        def check_batch(chunk):
+            results, _, _ = execute_gmail_batch(
+                service, chunk, lambda service, row: status_request(service, row["message_id"]), limiter, GMAIL_STATUS_COST
+            )
+            return [
+                (row, status_from_labels(response.get("labelIds", [])) if exception is None else None)
+                for row, response, exception in results
+            ]
+
+        if (transport or GMAIL_TRANSPORT) == "batch":
+            jobs = run_bounded(check_batch, chunked(rows, GMAIL_BATCH_SIZE), GMAIL_MAX_IN_FLIGHT)
+        else:
+            jobs = run_bounded(check_one, rows, GMAIL_MAX_IN_FLIGHT)
+
+        updates = []
+        for results in jobs:
+            for row, status in results:
+                if status is None:
+                    status = "UNKNOWN" if row["attempts"] + 1 >= RECONCILE_MAX_ATTEMPTS else "PENDING"
+                updates.append((status, row["id"]))
+        # Every worker process runs this job, so only deliveries this run resolved itself are scored
+        delivered = db.update_email_statuses(updates).get("DELIVERED", 0)
+        if delivered:
+            db.add_delivery_score(sender_email, delivered)
+        save_gmail_credentials(sender_email)
+
+scheduler.add_job(
+    reconcile_email_statuses,
+    "interval",
+    seconds=RECONCILE_INTERVAL,
+    id="reconcile_email_statuses",
+    max_instances=1,
+    coalesce=True,
+    replace_existing=True
+)
 
 #Send Outlook Mail
-def send_outlook(sender_email, recipients, subject, body, cc="", bcc=""):
+def send_outlook(sender_email, recipients, subject, body, cc="", bcc="", max_in_flight=None, transport=None, on_result=None, status_writer=None, fields=None):
     try:
-        delivery_score, access_token, refresh_token, client_id, client_secret, scopes = db.get_credentials_from_db_for_outlook(sender_email)
-        # Convert comma-separated scopes back to a space-separated string
-        scopes = " ".join(scopes.split(",")) if scopes else ""
-        new_access_token, new_refresh_token = refresh_outlook_access_token(client_id, client_secret, refresh_token, scopes)
+        access_token = get_outlook_access_token(sender_email)
         
-        access_token = new_access_token
+        headers = {
+            'Authorization': 'Bearer ' + access_token
+        }
+        limiter = get_limiter("outlook", sender_email)
 
-        for i in range(len(recipients)):
-            headers = {
-                'Authorization': 'Bearer ' + access_token
-            }
-            
-             # Initialize the message structure
-            message = {
-                'toRecipients': [
-                    {
-                        'emailAddress': {
-                            'address': recipients[i],
-                            'name': 'CrowdMail'
-                        }
-                    }
-                ],
-                'subject': subject,
-                'body': {
-                    'contentType': 'text',
-                    'content': body
-                }
-                # 'importance': 'low'
+        # Graph answers 401 once a token is revoked, the password is reset or consent is removed, which the
+        # token's expiry does not show. Requests sent with rejected_headers switch to a freshly refreshed token;
+        # a send refreshes at most once, so a mailbox that rejects new tokens too does not refresh per recipient.
+        renew_lock = threading.Lock()
+        token_renewed = threading.Event()
+
+        def renew_headers(rejected_headers):
+            with renew_lock:
+                if not token_renewed.is_set():
+                    rejected_token = rejected_headers['Authorization'][len('Bearer '):]
+                    headers['Authorization'] = 'Bearer ' + get_outlook_access_token(sender_email, rejected_token)
+                    token_renewed.set()
+            return headers
+        templates = compile_template(subject), compile_template(body)
+
+        def send_request(recipient):
+            return {
+                'method': 'POST',
+                'url': '/me/sendMail',
+                'body': {'message': create_outlook_message(recipient, *personalise(templates, recipient, fields), cc, bcc)}
             }
 
-            # Add CC if available
-            if cc:
-                cc_recipients = [{'emailAddress': {'address': email}} for email in cc.split(",")]
-                message['ccRecipients'] = cc_recipients
-            
-            # Add BCC if available
-            if bcc:
-                bcc_recipients = [{'emailAddress': {'address': email}} for email in bcc.split(",")]
-                message['bccRecipients'] = bcc_recipients
-            
-            request_body = {'message': message}
-            
-            requests.post('https://graph.microsoft.com/v1.0/me/sendMail', headers=headers, json=request_body)
-            message_id = None
-            status = "DELIVERED" #Assuming all the emails are delivered. because outlook api doesn't provide these informations.
-            delivery_score += 1
-            db.insert_email_status(recipients[i], "outlook", message_id, status)
-        db.update_tokens_for_outlook(sender_email, delivery_score, new_access_token, new_refresh_token)
-        return {"message": "Email Sent Successfully!"}, 200
+        def send_one(recipient):
+            renewed = False
+            for attempt in range(RATE_LIMIT_RETRIES + 1):
+                limiter.acquire()
+                request_headers = dict(headers)
+                try:
+                    response = graph_session.post(f"{GRAPH_API_URL}/me/sendMail", headers=request_headers, json=send_request(recipient)['body'])
+                except Exception as e:
+                    status = "FAILED"
+                    if not isinstance(e, TRANSIENT_ERRORS):
+                        break
+                    retry_after = None
+                else:
+                    status = outlook_status(response.status_code)
+                    if response.status_code == 401 and not renewed:
+                        # Retried once with a fresh token
+                        renewed = True
+                        renew_headers(request_headers)
+                        continue
+                    if response.status_code not in RETRYABLE_STATUS_CODES:
+                        if status == "DELIVERED":
+                            limiter.success()
+                        break
+                    retry_after = parse_retry_after(response.headers)
+                # Throttling, server errors and dropped connections all back the sender off with jitter
+                limiter.throttle(retry_after)
+            return [(recipient, status)], attempt + 1, attempt + 1
+
+        def send_batch(chunk):
+            return execute_graph_batch(headers, chunk, send_request, limiter, renew_headers)
+
+        if (transport or OUTLOOK_TRANSPORT) == "batch":
+            jobs = run_bounded(send_batch, chunked(recipients, GRAPH_BATCH_SIZE), max_in_flight or OUTLOOK_MAX_IN_FLIGHT)
+        else:
+            jobs = run_bounded(send_one, recipients, max_in_flight or OUTLOOK_MAX_IN_FLIGHT)
+
+        total_round_trips = total_calls = 0
+        counts = {}
+        with status_writer or db.status_writer() as writer:
+            for results, round_trips, calls in jobs:
+                total_round_trips += round_trips
+                total_calls += calls
+                for recipient, status in results:
+                    counts[status] = counts.get(status, 0) + 1
+                    # A caller taking results writes the status row itself, together with its own checkpoint
+                    if on_result:
+                        on_result(recipient, None, status)
+                    else:
+                        writer.add(recipient, "outlook", None, status, sender_email)
+        # Graph only reports that the message was accepted; accepted mails are counted as delivered
+        if counts.get("DELIVERED"):
+            db.add_delivery_score(sender_email, counts["DELIVERED"], "outlook")
+        return {
+            "message": "Email Sent Successfully!",
+            "status_counts": counts,
+            "round_trips": total_round_trips,
+            "round_trips_saved": total_calls - total_round_trips
+        }, 200
     except Exception as e:
         return {"error": f"An unexpected error occurred: {e}"}, 500
+
+# Map a Graph sendMail HTTP status to a delivery status
+def outlook_status(status_code):
+    if status_code in (200, 202):
+        return "DELIVERED"
+    elif status_code == 429:
+        return "THROTTLED"
+    return "FAILED"
+
+# Send the Graph requests built by request_for(item) for one chunk of at most 20 items as a single $batch call.
+# Sub-requests that are throttled or fail on the server are retried on their own after the longest Retry-After.
+# With a limiter, every attempt first takes one token per sub-request and throttled sub-requests slow it down.
+# With renew_headers, sub-requests rejected with 401 are retried once with the headers it returns for a new token.
+# Returns ([(item, status)], round_trips, calls).
+def execute_graph_batch(headers, items, request_for, limiter=None, renew_headers=None):
+    pending = {str(index): item for index, item in enumerate(items)}
+    results = []
+    round_trips = calls = 0
+    renewed = False
+    for attempt in range(GRAPH_BATCH_RETRIES + 1):
+        headers = dict(headers)
+        if limiter:
+            limiter.acquire(len(pending))
+        batch_requests = []
+        for request_id, item in pending.items():
+            sub_request = request_for(item)
+            sub_request['id'] = request_id
+            sub_request['headers'] = {'Content-Type': 'application/json'}
+            batch_requests.append(sub_request)
+        try:
+            response = graph_session.post(f"{GRAPH_API_URL}/$batch", headers=headers, json={'requests': batch_requests})
+            if response.status_code == 200:
+                responses = {sub['id']: sub for sub in response.json().get('responses', [])}
+            else:
+                # The envelope itself was rejected, so every sub-request shares its status
+                responses = {request_id: {'status': response.status_code, 'headers': dict(response.headers)} for request_id in pending}
+        except Exception as e:
+            print(f"Graph batch request failed: {e}")
+            responses = {}
+        round_trips += 1
+        calls += len(pending)
+
+        retry = {}
+        delay = 0
+        throttled = False
+        throttle_delay = None
+        unauthorized = False
+        for request_id, item in pending.items():
+            sub_response = responses.get(request_id, {})
+            status_code = sub_response.get('status')
+            seconds = parse_retry_after(sub_response.get('headers'))
+            if status_code == 401 and renew_headers and not renewed and attempt < GRAPH_BATCH_RETRIES:
+                unauthorized = True
+                retry[request_id] = item
+                continue
+            if status_code == 429:
+                throttled = True
+                if seconds is not None:
+                    throttle_delay = max(throttle_delay or 0, seconds)
+            if attempt < GRAPH_BATCH_RETRIES and (status_code is None or status_code in RETRYABLE_STATUS_CODES):
+                retry[request_id] = item
+                delay = max(delay, 2 ** attempt if seconds is None else seconds)
+            else:
+                results.append((item, outlook_status(status_code)))
+        if limiter:
+            if throttled:
+                limiter.throttle(throttle_delay)
+            elif len(pending) > len(retry):
+                limiter.success(len(pending) - len(retry))
+        if unauthorized:
+            renewed = True
+            headers = renew_headers(headers)
+        if not retry:
+            break
+        pending = retry
+        if not (limiter and throttled):
+            time.sleep(delay)
+    return results, round_trips, calls
+
+# Create Message for Outlook
+def create_outlook_message(to, subject, body, cc="", bcc=""):
+    # Initialize the message structure
+    message = {
+        'toRecipients': [
+            {
+                'emailAddress': {
+                    'address': to,
+                    'name': 'CrowdMail'
+                }
+            }
+        ],
+        'subject': subject,
+        'body': {
+            'contentType': 'text',
+            'content': body
+        }
+        # 'importance': 'low'
+    }
+
+    # Add CC if available
+    if cc:
+        cc_recipients = [{'emailAddress': {'address': email}} for email in cc.split(",")]
+        message['ccRecipients'] = cc_recipients
     
+    # Add BCC if available
+    if bcc:
+        bcc_recipients = [{'emailAddress': {'address': email}} for email in bcc.split(",")]
+        message['bccRecipients'] = bcc_recipients
+    return message
+    
+# Get a usable Outlook access token for a mailbox, refreshing it only when it is close to expiry.
+# A lock per mailbox makes concurrent senders wait for a single refresh instead of each starting one.
+# rejected_token is a token Graph answered 401 to; it is dropped and refreshed whatever its expiry says,
+# while callers that were rejected with a token already replaced get the new one.
+def get_outlook_access_token(sender_email, rejected_token=None):
+    with outlook_token_locks_guard:
+        lock = outlook_token_locks.setdefault(sender_email, threading.Lock())
+    with lock:
+        cached = outlook_tokens.get(sender_email)
+        if cached and rejected_token and cached["access_token"] == rejected_token:
+            del outlook_tokens[sender_email]
+            cached = None
+        if cached and cached["expires_at"] - OUTLOOK_TOKEN_REFRESH_MARGIN > time.time():
+            return cached["access_token"]
+
+        credentials = db.get_credentials_from_db_for_outlook(sender_email)
+        if not credentials:
+            raise Exception("User not Authenticated or Email Disabled")
+        _, access_token, refresh_token, client_id, client_secret, scopes, expires_at = credentials
+        # A token stored by another process may still be good, unless it is the one just rejected
+        if access_token == rejected_token or not (expires_at and expires_at - OUTLOOK_TOKEN_REFRESH_MARGIN > time.time()):
+            # Convert comma-separated scopes back to a space-separated string
+            scopes = " ".join(scopes.split(",")) if scopes else ""
+            access_token, refresh_token, expires_in = refresh_outlook_access_token(client_id, client_secret, refresh_token, scopes)
+            expires_at = time.time() + expires_in
+            # Save rotated tokens so other processes and restarts can reuse them
+            db.update_tokens_for_outlook(sender_email, None, access_token, refresh_token, expires_at)
+        outlook_tokens[sender_email] = {"access_token": access_token, "expires_at": expires_at}
+        return access_token
+
 #Refresh Access Token
 def refresh_outlook_access_token(client_id, client_secret, refresh_token, scopes):
-    url = "https://login.microsoftonline.com/common/oauth2/v2.0/token"
     # Ensure required scopes are included
     mandatory_scopes = "openid profile offline_access"
     combined_scopes = f"{mandatory_scopes} {scopes}" if scopes else mandatory_scopes
@@ -368,14 +1154,15 @@ def refresh_outlook_access_token(client_id, client_secret, refresh_token, scopes
         'scope': combined_scopes
     }
     
-    response = requests.post(url, data=data)
+    response = graph_session.post(OUTLOOK_TOKEN_URL, data=data)
     
     if response.status_code == 200:
         tokens = response.json()
         # Update both access and refresh tokens
         new_access_token = tokens['access_token']
         new_refresh_token = tokens.get('refresh_token', refresh_token)  # Fallback to old if not rotated
-        return new_access_token, new_refresh_token
+        expires_in = int(tokens.get('expires_in', 3600))
+        return new_access_token, new_refresh_token, expires_in
     else:
         raise Exception(f"Failed to refresh token: {response.json()}")
 
@@ -432,11 +1219,47 @@ def update_template(template_id):
     return jsonify(result), status_code
 
 #Get All Email Templates Available
+# ?fields=summary returns only id, name and subject; bodies are fetched with /get_template/<id>.
+# With ?limit, ?cursor or ?name (a name prefix) the list is paginated (see paginate).
+# Responses carry an ETag so unchanged lists are answered with 304 Not Modified.
 @app.route('/get_templates', methods=['GET'])
 def get_templates():
     try:
-        response = db.get_email_templates()
-        return jsonify(response), 200
+        summary = request.args.get("fields") == "summary"
+        paginated = any(arg in request.args for arg in ("limit", "cursor", "name"))
+        etag = f"templates-{db.get_templates_version()}{'-summary' if summary else ''}"
+        if paginated:
+            page_key = json.dumps([request.args.get(arg) for arg in ("limit", "cursor", "name")])
+            etag += "-" + base64.urlsafe_b64encode(page_key.encode()).decode().rstrip("=")
+        if request.if_none_match.contains(etag):
+            return "", 304, {"ETag": f'"{etag}"'}
+        if paginated:
+            response = paginate(lambda after, limit: db.get_email_templates_page(
+                request.args.get("name"), summary, after, limit
+            ))
+        else:
+            response = db.get_email_template_summaries() if summary else db.get_email_templates()
+        response = jsonify(response)
+        response.set_etag(etag)
+        return response, 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#Get One Email Template with its Body
+@app.route('/get_template/<int:template_id>', methods=['GET'])
+def get_template(template_id):
+    try:
+        etag = f"template-{template_id}-{db.get_templates_version()}"
+        if request.if_none_match.contains(etag):
+            return "", 304, {"ETag": f'"{etag}"'}
+        template = db.get_email_template(template_id)
+        if not template:
+            return jsonify({"error": "Template not found!"}), 404
+        response = jsonify(template)
+        response.set_etag(etag)
+        return response, 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -446,14 +1269,95 @@ def dashboard_statistics():
     stats = db.get_dashboard_statistics()
     return jsonify(stats), 200
 
+#Get Sent, Delivered, Inboxed, Spammed and Failed Counts per Time Bucket
+# ?granularity=hour|day (default day), ?since and ?until (default: the last 48 hours or 30 days),
+# ?service, ?sender and ?group_by=sender|service|total. Read from the rollup tables, not raw history.
+@app.route("/stats/timeseries", methods=["GET"])
+def stats_timeseries():
+    try:
+        granularity = request.args.get("granularity", "day")
+        group_by = request.args.get("group_by", "sender")
+        if granularity not in TIMESERIES_DEFAULT_RANGE:
+            return jsonify({"error": "granularity must be 'hour' or 'day'"}), 400
+        if group_by not in ("sender", "service", "total"):
+            return jsonify({"error": "group_by must be 'sender', 'service' or 'total'"}), 400
+        until = parse_timestamp(request.args.get("until")) or (datetime.now(timezone.utc) + timedelta(hours=1)).strftime("%Y-%m-%d %H:00:00")
+        since = parse_timestamp(request.args.get("since")) or (
+            datetime.strptime(until, "%Y-%m-%d %H:%M:%S") - TIMESERIES_DEFAULT_RANGE[granularity]
+        ).strftime("%Y-%m-%d %H:%M:%S")
+        series = db.get_timeseries(
+            granularity, since, until, request.args.get("service"), request.args.get("sender"), group_by
+        )
+        return jsonify({"granularity": granularity, "since": since, "until": until, "buckets": series}), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 #Get Verified Emails
+# With ?limit or ?cursor the list is paginated and can be narrowed by ?service, ?status and ?email (a prefix)
 @app.route("/oauth_emails", methods=["GET"])
 def oauth_emails():
     try:
-        emails = db.get_oauth_emails()
-        return jsonify(emails), 200
+        if not any(arg in request.args for arg in ("limit", "cursor", "service", "status", "email")):
+            emails = db.get_oauth_emails()
+            return jsonify(emails), 200
+        return jsonify(paginate(lambda after, limit: db.get_oauth_emails_page(
+            request.args.get("service"), request.args.get("status"), request.args.get("email", "").lower(), after, limit
+        ))), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+#Get Send History, newest first
+# Filters: ?status, ?service, ?sender, ?recipient (a prefix), ?since and ?until (YYYY-MM-DD[ HH:MM:SS])
+@app.route("/email_status", methods=["GET"])
+def email_status_history():
+    try:
+        since, until = (parse_timestamp(request.args.get(arg)) for arg in ("since", "until"))
+        return jsonify(paginate(lambda after, limit: db.get_email_status_page(
+            request.args.get("status"), request.args.get("service"), request.args.get("sender"),
+            request.args.get("recipient", "").lower(), since, until, after, limit, request.args.get("campaign_id", type=int)
+        ))), 200
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Keyset pagination for list endpoints: ?limit rows (at most MAX_PAGE_SIZE) after the opaque ?cursor
+# returned as next_cursor by the previous page. fetch_page(after, limit) returns (rows, next_after).
+def paginate(fetch_page):
+    try:
+        limit = int(request.args.get("limit", PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be a number")
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    cursor = request.args.get("cursor")
+    after = None
+    if cursor:
+        try:
+            after = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except Exception:
+            raise ValueError("Invalid cursor")
+        if not isinstance(after, list):
+            raise ValueError("Invalid cursor")
+    items, next_after = fetch_page(after, limit)
+    next_cursor = None
+    if next_after is not None:
+        next_cursor = base64.urlsafe_b64encode(json.dumps(next_after).encode()).decode().rstrip("=")
+    return {"items": items, "next_cursor": next_cursor}
+
+# Normalise an optional YYYY-MM-DD or YYYY-MM-DD HH:MM:SS filter to the format SQLite timestamps use
+def parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise ValueError(f"Invalid date '{value}'. Please use 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS'.")
+
+resume_campaigns()
+
 if __name__ == "__main__":
     app.run(port=5000)
\ No newline at end of file
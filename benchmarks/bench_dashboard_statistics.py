@@ -0,0 +1,52 @@
+# Measure Database.get_dashboard_statistics latency as email_status grows.
+#
+# Usage: python benchmarks/bench_dashboard_statistics.py [rows ...]
+# Default sizes are 10k, 100k and 1M rows; pass 10000000 to include 10M (takes a while to load).
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+
+STATUSES = ["DELIVERED", "DELIVERED", "DELIVERED", "SPAMMED", "FAILED", "INBOXED", "UNKNOWN", "PENDING"]
+SERVICES = ["gmail", "outlook"]
+
+
+def grow(db, current, target):
+    conn = db._connect()
+    rows = (
+        (f"user{i}@example.com", random.choice(SERVICES), f"msg{i}", random.choice(STATUSES), "sender@example.com")
+        for i in range(current, target)
+    )
+    with conn:
+        conn.executemany(
+            "INSERT INTO email_status (recipient, service, message_id, status, sender) VALUES (?, ?, ?, ?, ?)", rows
+        )
+    db._release(conn)
+
+
+def measure(db, repeat=20):
+    db.get_dashboard_statistics()  # Warm the page cache
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        db.get_dashboard_statistics()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        current = 0
+        for size in sorted(sizes):
+            grow(db, current, size)
+            current = size
+            print(f"{size:>12,} rows: {measure(db) * 1000:8.2f} ms (median)")
+        db.close()
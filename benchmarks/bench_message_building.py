@@ -0,0 +1,57 @@
+# Compare building Gmail raw payloads with create_message, which serialises and encodes the whole
+# MIME message per recipient, against a MessageSkeleton encoded once per campaign.
+# Memory is the peak traced by tracemalloc while building one message.
+#
+# Usage: python benchmarks/bench_message_building.py [messages] [body_kib]
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from message_builder import create_message, MessageSkeleton
+
+SUBJECT = "Quarterly update"
+CC = "team@example.com"
+
+
+def bench_create_message(body, messages):
+    start = time.perf_counter()
+    for i in range(messages):
+        create_message("me", f"user{i}@example.com", SUBJECT, body, CC)
+    return messages / (time.perf_counter() - start)
+
+
+def bench_skeleton(body, messages):
+    start = time.perf_counter()
+    skeleton = MessageSkeleton("me", SUBJECT, body, CC)
+    for i in range(messages):
+        skeleton.create_message(f"user{i}@example.com")
+    return messages / (time.perf_counter() - start)
+
+
+def peak_per_message(build, samples=50):
+    peaks = []
+    for i in range(samples):
+        # A fresh trace per sample resets the peak; tracemalloc.reset_peak needs Python 3.9
+        tracemalloc.start()
+        build(f"user{i}@example.com")
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks)
+
+
+if __name__ == "__main__":
+    messages = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    body_kib = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    body = ("Hello from the mass mailer. " * (body_kib * 1024 // 28 + 1))[:body_kib * 1024]
+
+    plain = bench_create_message(body, messages)
+    spliced = bench_skeleton(body, messages)
+    skeleton = MessageSkeleton("me", SUBJECT, body, CC)
+    plain_peak = peak_per_message(lambda to: create_message("me", to, SUBJECT, body, CC))
+    spliced_peak = peak_per_message(skeleton.create_message)
+
+    print(f"messages: {messages}, body: {body_kib} KiB")
+    print(f"create_message:  {plain:,.0f} messages/sec, {plain_peak / 1024:,.1f} KiB peak/message")
+    print(f"MessageSkeleton: {spliced:,.0f} messages/sec, {spliced_peak / 1024:,.1f} KiB peak/message ({spliced / plain:.1f}x)")
@@ -0,0 +1,37 @@
+# Compare email_status write throughput: one connection and commit per row
+# (Database.insert_email_status) against the batched EmailStatusWriter.
+#
+# Usage: python benchmarks/bench_status_writes.py [rows]
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from database import Database
+
+
+def bench_single(db, rows):
+    start = time.perf_counter()
+    for i in range(rows):
+        db.insert_email_status(f"user{i}@example.com", "gmail", f"msg{i}", "PENDING", "sender@example.com")
+    return rows / (time.perf_counter() - start)
+
+
+def bench_batched(db, rows):
+    start = time.perf_counter()
+    with db.status_writer() as writer:
+        for i in range(rows):
+            writer.add(f"user{i}@example.com", "gmail", f"msg{i}", "PENDING", "sender@example.com")
+    return rows / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        single = bench_single(db, rows)
+        batched = bench_batched(db, rows)
+    print(f"rows: {rows}")
+    print(f"insert_email_status: {single:,.0f} rows/sec")
+    print(f"EmailStatusWriter:   {batched:,.0f} rows/sec ({batched / single:.1f}x)")
@@ -0,0 +1,310 @@
+# Measure send throughput without Google or Microsoft accounts. A local stand-in server emulates Gmail
+# (messages.send, messages.get and batch requests) and Graph (sendMail, $batch and the token endpoint) with
+# configurable latency, error rate and share of 429 responses. Each scenario drives the real send path
+# against it through GMAIL_API_ENDPOINT, GRAPH_API_URL and OUTLOOK_TOKEN_URL:
+#   gmail      send_gmail to every recipient
+#   outlook    send_outlook to every recipient
+#   route      POST /send_mass_mail with a CSV and wait for the background campaign to finish
+#   reconcile  resolve the PENDING Gmail statuses left by a send with reconcile_email_statuses
+# Latency is measured per HTTP round trip, so a batch request counts once. Every scenario runs in its own
+# process on a fresh database in a temporary directory, so its peak RSS is its own.
+#
+# Usage: python benchmarks/bench_transport.py [--messages N] [--latency-ms MS] [--error-rate P]
+#            [--throttle-rate P] [--retry-after S] [--transport single|batch] [--rate N] [scenario ...]
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import count
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("gmail", "outlook", "route", "reconcile")
+GMAIL_SENDER = "bench@gmail.test"
+OUTLOOK_SENDER = "bench@outlook.test"
+SUBJECT = "Quarterly update"
+BODY = "Hello from the mass mailer. " * 40
+REASONS = {200: "OK", 202: "Accepted", 429: "Too Many Requests", 500: "Internal Server Error"}
+
+
+# Stand-in for both providers. Every HTTP request waits latency seconds; each message in it then fails
+# with a 429 or a 500 at the configured rates, independently of the others in the same batch.
+class FakeProvider(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency, error_rate, throttle_rate, retry_after):
+        super().__init__(("127.0.0.1", 0), FakeProviderHandler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.message_ids = count(1)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def outcome(self, success=200):
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return success
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, as the real APIs
+    disable_nagle_algorithm = True  # Headers and body are written separately; don't let delayed ACKs stall them
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        if "/messages/" not in self.path:
+            return self.respond(404, {})
+        status = self.server.outcome()
+        self.respond(status, self.gmail_message(status, self.path.split("/messages/")[1].split("?")[0]))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.server.latency)
+        if self.path.endswith("/token"):
+            self.respond(200, {"access_token": "bench", "refresh_token": "bench", "expires_in": 3600})
+        elif self.path.startswith("/batch"):
+            self.gmail_batch(body)
+        elif self.path.endswith("/$batch"):
+            self.graph_batch(json.loads(body))
+        elif self.path.split("?")[0].endswith("/messages/send"):
+            status = self.server.outcome()
+            self.respond(status, self.gmail_message(status, str(next(self.server.message_ids))))
+        elif self.path.endswith("/sendMail"):
+            status = self.server.outcome(202)
+            self.respond(status, self.graph_error(status) if status != 202 else None)
+        else:
+            self.respond(404, {})
+
+    def respond(self, status, payload, content_type="application/json"):
+        data = payload if isinstance(payload, bytes) else b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if status == 429:
+            self.send_header("Retry-After", str(self.server.retry_after))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def gmail_message(self, status, message_id):
+        if status == 429:
+            return {"error": {"code": 429, "message": "Rate Limit Exceeded", "errors": [{"reason": "rateLimitExceeded"}]}}
+        if status != 200:
+            return {"error": {"code": status, "message": "Backend Error"}}
+        labels = random.choices((["SENT"], ["INBOX"], ["SPAM"]), weights=(8, 1, 1))[0]
+        return {"id": message_id, "threadId": message_id, "labelIds": labels}
+
+    def graph_error(self, status):
+        return {"error": {"code": "TooManyRequests" if status == 429 else "InternalServerError", "message": "Fake provider"}}
+
+    # multipart/mixed request of application/http parts, answered part for part under the same Content-ID
+    def gmail_batch(self, body):
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        boundary = "batch_bench"
+        out = io.StringIO()
+        for part in BytesParser().parsebytes(header + body).get_payload():
+            request_line = part.get_payload().split("\n", 1)[0].split()
+            if request_line[0] == "GET":
+                message_id = request_line[1].split("/messages/")[1].split("?")[0]
+            else:
+                message_id = str(next(self.server.message_ids))
+            status = self.server.outcome()
+            payload = json.dumps(self.gmail_message(status, message_id))
+            retry = f"Retry-After: {self.server.retry_after}\r\n" if status == 429 else ""
+            out.write(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{part['Content-ID'][1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json; charset=UTF-8\r\n{retry}\r\n{payload}\r\n"
+            )
+        out.write(f"--{boundary}--\r\n")
+        self.respond(200, out.getvalue().encode(), f"multipart/mixed; boundary={boundary}")
+
+    def graph_batch(self, batch):
+        responses = []
+        for sub_request in batch["requests"]:
+            status = self.server.outcome(202)
+            response = {"id": sub_request["id"], "status": status, "headers": {}}
+            if status == 429:
+                response["headers"]["Retry-After"] = str(self.server.retry_after)
+            if status != 202:
+                response["body"] = self.graph_error(status)
+            responses.append(response)
+        self.respond(200, {"responses": responses})
+
+
+# Verified mailboxes whose tokens outlive the run, so no refresh is attempted
+def seed_mailboxes(db):
+    conn = db._connect()
+    conn.execute("""
+        INSERT INTO oauth_credentials_for_gmail (email, status, delivery_score, token, refresh_token, token_uri, client_id, client_secret, scopes, token_expiry)
+        VALUES (?, 'enabled', 0, 'bench', 'bench', ?, 'bench', 'bench', 'https://www.googleapis.com/auth/gmail.send', '2999-01-01T00:00:00')
+    """, (GMAIL_SENDER, os.environ["OUTLOOK_TOKEN_URL"]))
+    conn.execute("""
+        INSERT INTO oauth_credentials_for_outlook (email, status, delivery_score, access_token, refresh_token, client_id, client_secret, scopes, token_expires_at)
+        VALUES (?, 'enabled', 0, 'bench', 'bench', 'bench', 'bench', 'Mail.Send', 32503680000)
+    """, (OUTLOOK_SENDER,))
+    conn.commit()
+    db._release(conn)
+
+
+# Time every HTTP round trip the app makes: httplib2 for Gmail and the shared requests session for Graph
+def record_latencies(app):
+    import httplib2
+    latencies = []
+
+    def timed(request):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return request(*args, **kwargs)
+            finally:
+                latencies.append(time.perf_counter() - start)
+        return wrapper
+
+    httplib2.Http.request = timed(httplib2.Http.request)
+    app.graph_session.request = timed(app.graph_session.request)
+    return latencies
+
+
+
+
+def scenario_gmail(app, recipients, args):
+    app.send_gmail(GMAIL_SENDER, recipients, SUBJECT, BODY, transport=args.transport)
+    return len(recipients)
+
+
+def scenario_outlook(app, recipients, args):
+    app.send_outlook(OUTLOOK_SENDER, recipients, SUBJECT, BODY, transport=args.transport)
+    return len(recipients)
+
+
+def scenario_route(app, recipients, args):
+    csv_file = io.BytesIO("\n".join(recipients).encode())
+    response = app.app.test_client().post("/send_mass_mail", content_type="multipart/form-data", data={
+        "email_service": "Gmail", "sender_email": GMAIL_SENDER, "subject": SUBJECT, "body": BODY,
+        "csv_file": (csv_file, "recipients.csv")
+    })
+    campaign_id = response.get_json()["campaign_id"]
+    while app.db.get_campaign(campaign_id)["state"] not in ("completed", "failed"):
+        time.sleep(0.05)
+    return len(recipients)
+
+
+def scenario_reconcile(app, recipients, args):
+    checked = 0
+    for _ in range(app.RECONCILE_MAX_ATTEMPTS):
+        pending = len(app.db.get_pending_email_statuses("gmail", len(recipients)))
+        if not pending:
+            break
+        app.reconcile_email_statuses(len(recipients), args.transport)
+        checked += pending
+    return checked
+
+
+# Run one scenario in this process and return its measurements
+def run_scenario(name, args):
+    os.chdir(tempfile.mkdtemp(prefix="bench_transport_"))
+    server = FakeProvider(args.latency_ms / 1000, args.error_rate, args.throttle_rate, args.retry_after)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ.update({
+        "GMAIL_API_ENDPOINT": server.url,
+        "GRAPH_API_URL": server.url + "/v1.0",
+        "OUTLOOK_TOKEN_URL": server.url + "/token",
+        "GMAIL_SEND_RATE": str(args.rate),
+        "OUTLOOK_SEND_RATE": str(args.rate),
+        "GMAIL_TRANSPORT": args.transport,  # The route scenario sends with the configured transports
+        "OUTLOOK_TRANSPORT": args.transport,
+        "RECONCILE_INTERVAL": "3600"  # Only the reconcile scenario checks statuses
+    })
+    sys.path.insert(0, ROOT)
+    import app
+
+    seed_mailboxes(app.db)
+    recipients = [f"user{i}@example.com" for i in range(args.messages)]
+    if name == "reconcile":
+        app.send_gmail(GMAIL_SENDER, recipients, SUBJECT, BODY, transport=args.transport)
+    latencies = record_latencies(app)
+    writes = app.db.total_changes()
+    start = time.perf_counter()
+    messages = globals()[f"scenario_{name}"](app, recipients, args)
+    elapsed = time.perf_counter() - start
+    writes = app.db.total_changes() - writes
+
+    conn = app.db._connect()
+    statuses = dict(conn.execute("SELECT status, COUNT(*) FROM email_status GROUP BY status").fetchall())
+    app.db._release(conn)
+    app.scheduler.shutdown(wait=False)
+    server.shutdown()
+
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100)
+    else:
+        cuts = (latencies or [0]) * 99
+    return {
+        "scenario": name,
+        "messages": messages,
+        "seconds": elapsed,
+        "messages_per_second": messages / elapsed,
+        "requests": len(latencies),
+        "p50_ms": cuts[49] * 1000,
+        "p99_ms": cuts[98] * 1000,
+        "db_rows_per_second": writes / elapsed,
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "statuses": statuses
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the Gmail and Graph send paths against a local fake provider")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help=", ".join(SCENARIOS))
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Delay of every HTTP request")
+    parser.add_argument("--error-rate", type=float, default=0, help="Share of messages answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="Share of messages answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with a 429")
+    parser.add_argument("--transport", choices=("single", "batch"), default="single")
+    parser.add_argument("--rate", type=float, default=1000, help="Send rate limit per mailbox, messages/sec")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}, choose from {', '.join(SCENARIOS)}")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args)))
+        sys.stdout.flush()
+        os._exit(0)  # Skip waiting on the app's background threads
+
+    options = [arg for arg in sys.argv[1:] if arg not in SCENARIOS]
+    print(f"messages: {args.messages}, latency: {args.latency_ms:g} ms, errors: {args.error_rate:.0%}, "
+          f"429s: {args.throttle_rate:.0%}, transport: {args.transport}")
+    print(f"{'scenario':<10} {'msgs/sec':>9} {'requests':>9} {'p50 ms':>8} {'p99 ms':>8} {'db rows/s':>10} {'peak RSS':>10}  statuses")
+    for name in args.scenarios:
+        child = subprocess.run([sys.executable, __file__, "--child", name, *options], stdout=subprocess.PIPE, text=True)
+        if child.returncode:
+            print(f"{name:<10} failed with exit code {child.returncode}")
+            continue
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"{name:<10} {result['messages_per_second']:>9,.0f} {result['requests']:>9,} {result['p50_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['db_rows_per_second']:>10,.0f} {result['peak_rss_mib']:>7.1f} MiB  {result['statuses']}")
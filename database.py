@@ -1,17 +1,84 @@
 import sqlite3
 import hashlib
 import os
+import sys
+import atexit
+import threading
+import weakref
+from datetime import datetime
 from google.oauth2.credentials import Credentials
 
+# Connection tuning
+DB_BUSY_TIMEOUT = float(os.environ.get("DB_BUSY_TIMEOUT", 30))  # Seconds to wait on a locked database
+DB_CACHE_SIZE_KIB = int(os.environ.get("DB_CACHE_SIZE_KIB", 16384))  # Page cache per connection
+
+# Time-bucket rollup tables of email_status and the expression giving a timestamp's bucket
+ROLLUP_BUCKETS = {
+    "email_status_hourly": "strftime('%Y-%m-%d %H:00:00', {timestamp})",
+    "email_status_daily": "strftime('%Y-%m-%d 00:00:00', {timestamp})",
+}
+ROLLUP_TABLES = {"hour": "email_status_hourly", "day": "email_status_daily"}
+
+# One thread's connection, kept in its thread-local storage. Python releases that storage when the thread
+# ends, which drops the holder and lets its finalizer close the connection.
+class ConnectionHolder:
+    def __init__(self, conn):
+        self.conn = conn
+
 class Database:
     def __init__(self, db_name="email_management.db"):
         self.db_name = db_name
+        self._local = threading.local()
+        self._connections = set()
+        self._connections_lock = threading.RLock()  # Reentrant: a finalizer may close a connection inside it
+        self._closed_changes = 0  # Rows changed on connections already closed
+        self._templates_cache = None  # (version, templates)
+        self._templates_lock = threading.Lock()
         self._initialize_database()
 
+    # Get this thread's connection, opening it on first use.
+    # WAL journaling lets dashboard reads run alongside status writes from the sending threads.
+    # The connection is closed when its thread ends (see ConnectionHolder), so request and worker threads
+    # do not leave connections and file descriptors behind.
+    def _connect(self):
+        holder = getattr(self._local, "holder", None)
+        conn = holder.conn if holder else None
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")  # Safe with WAL; skips the fsync on every commit
+            conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KIB}")
+            holder = ConnectionHolder(conn)
+            self._local.holder = holder
+            with self._connections_lock:
+                self._connections.add(conn)
+            weakref.finalize(holder, self._close_connection, conn)
+        elif conn.in_transaction:
+            conn.rollback()  # An earlier call on this thread failed part way through a write
+        return conn
+
+    def _close_connection(self, conn):
+        with self._connections_lock:
+            if conn not in self._connections:
+                return
+            self._connections.discard(conn)
+            self._closed_changes += conn.total_changes
+        conn.close()
+
+    # Rows inserted, updated or deleted through this database so far, on every connection it opened
+    def total_changes(self):
+        with self._connections_lock:
+            return self._closed_changes + sum(conn.total_changes for conn in self._connections)
+
+    # Hand the connection back; a write that failed before committing is rolled back so it holds no lock
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+
     # Initailize Database
     def _initialize_database(self):
-        conn = sqlite3.connect(self.db_name)
-        conn.row_factory = sqlite3.Row
+        conn = self._connect()
         cursor = conn.cursor()
         #For App Registration
         cursor.execute("""
@@ -59,9 +126,90 @@ class Database:
                 service TEXT,
                 message_id TEXT,
                 status TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                sender TEXT,
+                attempts INTEGER DEFAULT 0
+            )
+        """)
+        # Campaigns hold the payload needed to resume a send after a restart
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS campaigns (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                sender_email TEXT NOT NULL,
+                service TEXT NOT NULL,
+                subject TEXT,
+                body TEXT,
+                cc TEXT,
+                bcc TEXT,
+                send_time DATETIME,
+                state TEXT NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        # Outbox with one row per (campaign, recipient); state is queued, sending, sent or failed
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                campaign_id INTEGER NOT NULL,
+                recipient TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                claimed_at DATETIME,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (campaign_id, recipient)
             )
         """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_campaign_state ON outbox (campaign_id, state, id)")
+        # Columns added after the first release; older databases are migrated in place
+        self._add_column_if_missing(cursor, "email_status", "sender", "TEXT")
+        self._add_column_if_missing(cursor, "email_status", "attempts", "INTEGER DEFAULT 0")
+        self._add_column_if_missing(cursor, "oauth_credentials_for_outlook", "token_expires_at", "REAL")
+        self._add_column_if_missing(cursor, "oauth_credentials_for_gmail", "token_expiry", "TEXT")
+        # Mailbox each outbox row is sent from; a sharded campaign spreads its rows over several
+        if self._add_column_if_missing(cursor, "outbox", "sender_email", "TEXT"):
+            cursor.execute("""
+                UPDATE outbox SET sender_email = (SELECT sender_email FROM campaigns WHERE campaigns.id = outbox.campaign_id)
+            """)
+        # Per-recipient merge fields from extra CSV columns, as JSON
+        self._add_column_if_missing(cursor, "outbox", "fields", "TEXT")
+        # Progress reporting for campaigns running in the background
+        self._add_column_if_missing(cursor, "campaigns", "started_at", "DATETIME")
+        self._add_column_if_missing(cursor, "campaigns", "finished_at", "DATETIME")
+        self._add_column_if_missing(cursor, "campaigns", "last_error", "TEXT")
+        # Template a campaign was written from, and the recipients it queued after de-duplication
+        self._add_column_if_missing(cursor, "campaigns", "template_id", "INTEGER")
+        self._add_column_if_missing(cursor, "campaigns", "recipient_count", "INTEGER")
+        # HTTP round trips a campaign's sends took, and the calls batching saved, summed over every run
+        self._add_column_if_missing(cursor, "campaigns", "round_trips", "INTEGER NOT NULL DEFAULT 0")
+        self._add_column_if_missing(cursor, "campaigns", "round_trips_saved", "INTEGER NOT NULL DEFAULT 0")
+        # Campaign each status row was sent by; older rows predate campaigns and stay NULL
+        self._add_column_if_missing(cursor, "email_status", "campaign_id", "INTEGER")
+        # Per-campaign delivery figures and per-recipient lookups, leaving rows without a campaign out of the index
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_email_status_campaign_recipient ON email_status (campaign_id, recipient, status)
+            WHERE campaign_id IS NOT NULL
+        """)
+        # Every recipient of a campaign with its queue state and, once sent, its delivery status
+        cursor.execute("""
+            CREATE VIEW IF NOT EXISTS campaign_recipients AS
+            SELECT outbox.id, outbox.campaign_id, outbox.recipient, outbox.sender_email, outbox.state, outbox.updated_at,
+                email_status.status AS delivery_status, email_status.message_id
+            FROM outbox
+            LEFT JOIN email_status ON email_status.campaign_id = outbox.campaign_id AND email_status.recipient = outbox.recipient
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_outbox_campaign_sender_state ON outbox (campaign_id, sender_email, state, id)")
+        # Mails sent by one mailbox within a time window (daily quota, send history), newest first
+        cursor.execute("DROP INDEX IF EXISTS idx_email_status_sender_timestamp")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_status_sender_time ON email_status (sender, timestamp)")
+        # Send history pages, newest first, filtered by status or not at all, and recipient prefix lookups
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_status_status_timestamp ON email_status (status, timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_status_timestamp ON email_status (timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_status_recipient ON email_status (recipient)")
+        # Status aggregates come from the counter and rollup tables now, so their covering index only slowed inserts
+        cursor.execute("DROP INDEX IF EXISTS idx_email_status_status_service_timestamp")
+        # Mails waiting for reconciliation, in id order; rows leave the index once they are resolved
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_email_status_pending ON email_status (service, id) WHERE status = 'PENDING'")
+        self._create_counters(cursor)
+        self._create_rollups(cursor)
         #Create template_management
         cursor.execute("""
             CREATE TABLE IF NOT EXISTS email_templates (
@@ -72,9 +220,177 @@ class Database:
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         """)
+        # Version numbers bumped on every change to a cached table, shared by all processes
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS cache_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("INSERT OR IGNORE INTO cache_versions (name, version) VALUES ('email_templates', 0)")
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_email_templates_version_{event.lower()} AFTER {event} ON email_templates
+                BEGIN
+                    UPDATE cache_versions SET version = version + 1 WHERE name = 'email_templates';
+                END
+            """)
         
         conn.commit()
-        conn.close()
+        self._release(conn)
+
+    # Rollup counters of email_status rows per (status, service, sender).
+    # Triggers keep them current in the same transaction as every insert, update and delete.
+    def _create_counters(self, cursor):
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'email_status_counters'")
+        is_new = cursor.fetchone() is None
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS email_status_counters (
+                status TEXT NOT NULL,
+                service TEXT NOT NULL,
+                sender TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (status, service, sender)
+            )
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_email_status_counters_insert AFTER INSERT ON email_status
+            BEGIN
+                INSERT INTO email_status_counters (status, service, sender, count)
+                VALUES (NEW.status, COALESCE(NEW.service, ''), COALESCE(NEW.sender, ''), 1)
+                ON CONFLICT (status, service, sender) DO UPDATE SET count = count + 1;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_email_status_counters_update
+            AFTER UPDATE OF status, service, sender ON email_status
+            WHEN OLD.status IS NOT NEW.status OR OLD.service IS NOT NEW.service OR OLD.sender IS NOT NEW.sender
+            BEGIN
+                UPDATE email_status_counters SET count = count - 1
+                WHERE status = OLD.status AND service = COALESCE(OLD.service, '') AND sender = COALESCE(OLD.sender, '');
+                INSERT INTO email_status_counters (status, service, sender, count)
+                VALUES (NEW.status, COALESCE(NEW.service, ''), COALESCE(NEW.sender, ''), 1)
+                ON CONFLICT (status, service, sender) DO UPDATE SET count = count + 1;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_email_status_counters_delete AFTER DELETE ON email_status
+            BEGIN
+                UPDATE email_status_counters SET count = count - 1
+                WHERE status = OLD.status AND service = COALESCE(OLD.service, '') AND sender = COALESCE(OLD.sender, '');
+            END
+        """)
+        if is_new:
+            # Existing history predates the triggers, so count it once
+            self._rebuild_counters(cursor)
+
+    def _rebuild_counters(self, cursor):
+        cursor.execute("DELETE FROM email_status_counters")
+        cursor.execute("""
+            INSERT INTO email_status_counters (status, service, sender, count)
+            SELECT status, COALESCE(service, ''), COALESCE(sender, ''), COUNT(*)
+            FROM email_status GROUP BY status, COALESCE(service, ''), COALESCE(sender, '')
+        """)
+
+    # Time-bucketed rollups of email_status rows per (bucket, service, sender, status), one table per granularity.
+    # A row is counted in the bucket of its send timestamp; status updates move it between statuses in that bucket.
+    def _create_rollups(self, cursor):
+        for table, bucket in ROLLUP_BUCKETS.items():
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,))
+            is_new = cursor.fetchone() is None
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    bucket TEXT NOT NULL,
+                    service TEXT NOT NULL,
+                    sender TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (bucket, service, sender, status)
+                ) WITHOUT ROWID
+            """)
+            new_bucket = bucket.format(timestamp="COALESCE(NEW.timestamp, CURRENT_TIMESTAMP)")
+            old_bucket = bucket.format(timestamp="COALESCE(OLD.timestamp, CURRENT_TIMESTAMP)")
+            add_new = f"""
+                INSERT INTO {table} (bucket, service, sender, status, count)
+                VALUES ({new_bucket}, COALESCE(NEW.service, ''), COALESCE(NEW.sender, ''), NEW.status, 1)
+                ON CONFLICT (bucket, service, sender, status) DO UPDATE SET count = count + 1;
+            """
+            remove_old = f"""
+                UPDATE {table} SET count = count - 1
+                WHERE bucket = {old_bucket} AND service = COALESCE(OLD.service, '')
+                AND sender = COALESCE(OLD.sender, '') AND status = OLD.status;
+            """
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_insert AFTER INSERT ON email_status BEGIN {add_new} END")
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_update
+                AFTER UPDATE OF status, service, sender, timestamp ON email_status
+                WHEN OLD.status IS NOT NEW.status OR OLD.service IS NOT NEW.service
+                OR OLD.sender IS NOT NEW.sender OR OLD.timestamp IS NOT NEW.timestamp
+                BEGIN {remove_old} {add_new} END
+            """)
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_delete AFTER DELETE ON email_status BEGIN {remove_old} END")
+            if is_new:
+                # Existing history predates the triggers, so roll it up once
+                self._rebuild_rollup(cursor, table, bucket)
+
+    def _rebuild_rollup(self, cursor, table, bucket):
+        bucket = bucket.format(timestamp="COALESCE(timestamp, CURRENT_TIMESTAMP)")
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO {table} (bucket, service, sender, status, count)
+            SELECT {bucket}, COALESCE(service, ''), COALESCE(sender, ''), status, COUNT(*)
+            FROM email_status GROUP BY 1, 2, 3, 4
+        """)
+
+    # Recompute the rollup counters and time buckets from raw email_status rows, e.g. after a migration or manual edit
+    def rebuild_counters(self):
+        conn = self._connect()
+        try:
+            with conn:
+                cursor = conn.cursor()
+                self._rebuild_counters(cursor)
+                for table, bucket in ROLLUP_BUCKETS.items():
+                    self._rebuild_rollup(cursor, table, bucket)
+        finally:
+            self._release(conn)
+
+    # Per-bucket counts between since (inclusive) and until (exclusive), oldest first.
+    # granularity is "hour" or "day"; group_by is "sender" (per service and sender), "service" or "total".
+    def get_timeseries(self, granularity, since, until, service=None, sender=None, group_by="sender"):
+        table = ROLLUP_TABLES[granularity]
+        keys = {"sender": ["service", "sender"], "service": ["service"], "total": []}[group_by]
+        filters, params = ["bucket >= ?", "bucket < ?"], [since, until]
+        if service:
+            filters.append("service = ?")
+            params.append(service)
+        if sender:
+            filters.append("sender = ?")
+            params.append(sender)
+        columns = ", ".join(["bucket"] + keys)
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                SELECT {columns},
+                    SUM(count) AS sent,
+                    SUM(CASE WHEN status = 'DELIVERED' THEN count ELSE 0 END) AS delivered,
+                    SUM(CASE WHEN status = 'INBOXED' THEN count ELSE 0 END) AS inboxed,
+                    SUM(CASE WHEN status = 'SPAMMED' THEN count ELSE 0 END) AS spammed,
+                    SUM(CASE WHEN status = 'FAILED' THEN count ELSE 0 END) AS failed
+                FROM {table} WHERE {" AND ".join(filters)}
+                GROUP BY {columns} HAVING SUM(count) > 0 ORDER BY {columns}
+            """, params)
+            return [dict(row) for row in cursor.fetchall()]
+        finally:
+            self._release(conn)
+
+    # Add a column to an existing table unless it is already there
+    def _add_column_if_missing(self, cursor, table, column, definition):
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            return True
+        return False
 
     # Hash Password with SHA-256
     def hash_password(self, password):
@@ -97,7 +413,7 @@ class Database:
     def register_user(self, username, email, password, status, role):
         password_hash = self.hash_password(password)
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._connect()
             cursor = conn.cursor()
             cursor.execute("INSERT INTO users (username, email, password_hash, status, role) VALUES (?, ?, ?, ?, ?)", 
                            (username, email, password_hash, status, role))
@@ -106,118 +422,241 @@ class Database:
         except sqlite3.IntegrityError:
             return {"error": "Username or email already exists!"}, 409
         finally:
-            conn.close()
+            self._release(conn)
 
     # Verify Login User Details
     def verify_user(self, email, password, role, status):
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute("SELECT password_hash FROM users WHERE email = ? AND role = ? AND status = ?", (email, role, status))
         result = cursor.fetchone()
-        conn.close()
+        self._release(conn)
         if result and self.verify_password(password, result[0]):
             return {"message": "Login successful!"}, 200
         return {"error": "Incorrect email or password."}, 401
     
     #Store the Status of Mail
-    def insert_email_status(self, recipient, service, message_id, status):
+    def insert_email_status(self, recipient, service, message_id, status, sender=None):
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._connect()
             cursor = conn.cursor()
             cursor.execute("""
-                INSERT INTO email_status (recipient, service, message_id, status)
-                VALUES (?, ?, ?, ?)
-            """, (recipient, service, message_id, status))
+                INSERT INTO email_status (recipient, service, message_id, status, sender)
+                VALUES (?, ?, ?, ?, ?)
+            """, (recipient, service, message_id, status, sender))
             conn.commit()
         except Exception as e:
             return {f"Error updating email status for message ID {message_id}: {e}"}
         finally:
-            conn.close()
+            self._release(conn)
+
+    # Get Mails Still Waiting for a Delivery Status
+    # Mails of disabled or removed mailboxes cannot be checked and are left out, so they do not hold up the rest
+    def get_pending_email_statuses(self, service, limit):
+        table = "oauth_credentials_for_outlook" if service == "outlook" else "oauth_credentials_for_gmail"
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT id, sender, message_id, attempts FROM email_status
+            WHERE status = 'PENDING' AND service = ? AND sender IN (SELECT email FROM {table} WHERE status = 'enabled')
+            ORDER BY id LIMIT ?
+        """, (service, limit))
+        rows = [dict(row) for row in cursor.fetchall()]
+        self._release(conn)
+        return rows
+
+    # Resolve Many Pending Mail Statuses in One Transaction
+    # Rows another process resolved first are left alone; returns how many rows were changed per new status
+    def update_email_statuses(self, updates):
+        by_status = {}
+        for status, status_id in updates:
+            by_status.setdefault(status, []).append((status, status_id))
+        changed = {}
+        conn = self._connect()
+        try:
+            for status, rows in by_status.items():
+                cursor = conn.executemany("""
+                    UPDATE email_status SET status = ?, attempts = attempts + 1 WHERE id = ? AND status = 'PENDING'
+                """, rows)
+                changed[status] = cursor.rowcount
+            conn.commit()
+            return changed
+        finally:
+            self._release(conn)
 
     # Get Dashboard Statistics
     def get_dashboard_statistics(self):
+        conn = self._connect()
         try:
-            conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
-            #delivered mail count
-            cursor.execute("SELECT COUNT(*) FROM email_status WHERE status = 'DELIVERED' ")
-            delivered_count = cursor.fetchone()[0]
-            #spammed mail count
-            cursor.execute("SELECT COUNT(*) FROM email_status WHERE status = 'SPAMMED' ")
-            spammed_count = cursor.fetchone()[0]
-            #failed mail count
-            cursor.execute("SELECT COUNT(*) FROM email_status WHERE status = 'FAILED' ")
-            failed_count = cursor.fetchone()[0]
-
-            sent_count = delivered_count + spammed_count + failed_count
-            # Sample statistics; in a real scenario, store and retrieve these values properly
+            # Read the trigger-maintained counters instead of counting history
+            cursor.execute("SELECT status, SUM(count) FROM email_status_counters GROUP BY status")
+            counts = dict(cursor.fetchall())
+
             stats = {
-                "sent_count": sent_count,
-                "delivered_count": delivered_count,
-                "spammed_count": spammed_count,
-                "failed_count": failed_count
+                # Every recorded mail was sent, whatever its outcome
+                "sent_count": sum(counts.values()),
+                "delivered_count": counts.get("DELIVERED", 0),
+                "spammed_count": counts.get("SPAMMED", 0),
+                "failed_count": counts.get("FAILED", 0),
+                "inboxed_count": counts.get("INBOXED", 0),
+                "unknown_count": counts.get("UNKNOWN", 0),
+                "pending_count": counts.get("PENDING", 0),
+                "throttled_count": counts.get("THROTTLED", 0)
             }
             return stats
         except Exception as e:
             return {"error": f"Database query failed due to following Error - {e}"}
         finally:
-            conn.close()
+            self._release(conn)
 
     #Get Verified Emails in Database
     def get_oauth_emails(self):
         try:
-            db = Database()
-            conn = sqlite3.connect(self.db_name)
-            cursor = conn.cursor()
-            
-            # Query for Gmail credentials
-            cursor.execute("""
-                SELECT email, status, delivery_score FROM oauth_credentials_for_gmail GROUP BY email
-            """)
-            gmail_emails = cursor.fetchall()
+            emails, _ = self.get_oauth_emails_page(limit=None)
+            return emails
+        except Exception as e:
+            return {"error": f"Database query failed: {e}"}
 
-            # Query for Outlook credentials
-            cursor.execute("""
-                SELECT email, status, delivery_score FROM oauth_credentials_for_outlook GROUP BY email
-            """)
-            outlook_emails = cursor.fetchall()
+    # One page of verified mailboxes of both services, ordered by (service, email)
+    def get_oauth_emails_page(self, service=None, status=None, email_prefix=None, after=None, limit=50):
+        filters, params = [], []
+        if service:
+            filters.append("service = ?")
+            params.append(service)
+        if status:
+            filters.append("status = ?")
+            params.append(status)
+        self._add_prefix_filter(filters, params, "email", email_prefix)
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            rows, next_after = self._keyset_page(cursor, """
+                SELECT * FROM (
+                    SELECT 'gmail' AS service, email, status, delivery_score FROM oauth_credentials_for_gmail
+                    UNION ALL
+                    SELECT 'outlook' AS service, email, status, delivery_score FROM oauth_credentials_for_outlook
+                )
+            """, filters, params, ("service", "email"), after, limit)
 
             # Get the dashboard statistics
-            stats = db.get_dashboard_statistics()
+            stats = self.get_dashboard_statistics()
             sent_count = stats.get('sent_count')
 
-            # Process Gmail emails
-            gmail_email_data = [{"email": row[0], "status": row[1], "delivery_score": row[2], "deliverability": (row[2] / sent_count) * 100} for row in gmail_emails]
-
-            # Process Outlook emails
-            outlook_email_data = [{"email": row[0], "status": row[1], "delivery_score": row[2], "deliverability": (row[2] / sent_count) * 100} for row in outlook_emails]
+            # Per-mailbox totals from the rollup counters, for the mailboxes on this page only
+            mailbox_counts = {}
+            for chunk in range(0, len(rows), 500):
+                senders = [row["email"] for row in rows[chunk:chunk + 500]]
+                cursor.execute(f"""
+                    SELECT service, sender, SUM(count), SUM(CASE WHEN status = 'DELIVERED' THEN count ELSE 0 END)
+                    FROM email_status_counters WHERE sender IN ({", ".join("?" * len(senders))}) GROUP BY service, sender
+                """, senders)
+                mailbox_counts.update({(row[0], row[1]): (row[2], row[3]) for row in cursor.fetchall()})
 
-            # Combine Gmail and Outlook email data
-            emails = gmail_email_data + outlook_email_data
+            emails = []
+            for row in rows:
+                mailbox_sent, mailbox_delivered = mailbox_counts.get((row["service"], row["email"]), (0, 0))
+                delivery_score = row["delivery_score"]
+                emails.append({
+                    "email": row["email"],
+                    "service": row["service"],
+                    "status": row["status"],
+                    "delivery_score": delivery_score,
+                    "deliverability": ((delivery_score or 0) / sent_count) * 100 if sent_count else 0,
+                    "sent_count": mailbox_sent,
+                    "delivered_count": mailbox_delivered
+                })
+            return emails, next_after
+        finally:
+            self._release(conn)
 
-            return emails
-        except Exception as e:
-            return {"error": f"Database query failed: {e}"}
+    # Send history, newest first, narrowed by status, service, sender, recipient prefix and a time range
+    def get_email_status_page(self, status=None, service=None, sender=None, recipient_prefix=None, since=None, until=None, after=None, limit=50, campaign_id=None):
+        filters, params = [], []
+        for column, value in (("status", status), ("service", service), ("sender", sender), ("campaign_id", campaign_id)):
+            if value:
+                filters.append(f"{column} = ?")
+                params.append(value)
+        self._add_prefix_filter(filters, params, "recipient", recipient_prefix)
+        if since:
+            filters.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            filters.append("timestamp < ?")
+            params.append(until)
+        conn = self._connect()
+        try:
+            return self._keyset_page(conn.cursor(), """
+                SELECT id, recipient, service, sender, message_id, status, timestamp, campaign_id FROM email_status
+            """, filters, params, ("timestamp", "id"), after, limit, descending=True)
         finally:
-            conn.close()
-    
+            self._release(conn)
+
+    # One page of a keyset-paginated query, ordered by the key columns (the last one unique).
+    # after holds the key values of the previous page's last row, so a page costs the same however deep it is.
+    # Returns (rows, next_after), where next_after is None on the last page; limit=None returns every row.
+    def _keyset_page(self, cursor, select, filters, params, key, after, limit, descending=False):
+        filters, params = list(filters), list(params)
+        if after and len(after) != len(key):
+            raise ValueError("Invalid cursor")
+        if after:
+            filters.append(f"({', '.join(key)}) {'<' if descending else '>'} ({', '.join('?' * len(key))})")
+            params.extend(after)
+        query = select
+        if filters:
+            query += " WHERE " + " AND ".join(filters)
+        direction = "DESC" if descending else "ASC"
+        query += " ORDER BY " + ", ".join(f"{column} {direction}" for column in key)
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit + 1)
+        cursor.execute(query, params)
+        rows = [dict(row) for row in cursor.fetchall()]
+        if limit is None or len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, [rows[-1][column] for column in key]
+
+    # Prefix match written as a range, so it can use an index on the column
+    def _add_prefix_filter(self, filters, params, column, prefix):
+        if prefix:
+            filters.append(f"{column} >= ? AND {column} < ?")
+            params.extend((prefix, prefix + "\U0010ffff"))
+
     #Put Delivery Score
     def put_delivery_score(self, sender_email, final):
+        conn = self._connect()
         try:
-            conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
             cursor.execute("""
                 UPDATE oauth_credentials_for_gmail SET delivery_score = ? WHERE email = ?
             """, (final, sender_email,))
             conn.commit()
-            conn.close()
             return {"message": "Successfully Updated."}, 200
         except Exception as e:
             return {"error": f"Error Occured. {e}"}, 400
-    
+        finally:
+            self._release(conn)
+
+    #Add to Delivery Score
+    def add_delivery_score(self, sender_email, count, service="gmail"):
+        table = "oauth_credentials_for_outlook" if service == "outlook" else "oauth_credentials_for_gmail"
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                UPDATE {table} SET delivery_score = COALESCE(delivery_score, 0) + ? WHERE email = ?
+            """, (count, sender_email,))
+            conn.commit()
+            return {"message": "Successfully Updated."}, 200
+        except Exception as e:
+            return {"error": f"Error Occured. {e}"}, 400
+        finally:
+            self._release(conn)
+
     # Store Credentials
     def store_credentials_for_gmail(self, email, credentials, status, delivery_score):
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
 
         # Check if the email already exists in the database
@@ -260,11 +699,11 @@ class Database:
             ))
 
         conn.commit()
-        conn.close()
+        self._release(conn)
 
     # Store Outlook Credentials
     def store_credentials_for_outlook(self, user_email, access_token, refresh_token, client_id, client_secret, scopes, status, delivery_score):
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
 
         # Check if the email already exists in the database
@@ -305,23 +744,22 @@ class Database:
             ))
 
         conn.commit()
-        conn.close()
+        self._release(conn)
 
     # Retrieve credentials
     def get_credentials_from_db_for_gmail(self, email):
-        conn = sqlite3.connect(self.db_name)
-        conn.row_factory = sqlite3.Row  # Enable dictionary-like row access
+        conn = self._connect()
         cursor = conn.cursor()
         try:
             cursor.execute("""
-                SELECT token, refresh_token, token_uri, client_id, client_secret, scopes
+                SELECT token, refresh_token, token_uri, client_id, client_secret, scopes, token_expiry
                 FROM oauth_credentials_for_gmail WHERE email = ? AND status = 'enabled'
             """, (email,))
             result = cursor.fetchone()
 
             # Handle the case where no credentials are found
             if not result:
-                conn.close()
+                self._release(conn)
                 return None, None
 
             cursor.execute("""
@@ -332,7 +770,7 @@ class Database:
 
             # Handle the case where no delivery score is found
             final_value = delivery_score_result[0] if delivery_score_result else 0
-            conn.close()
+            self._release(conn)
 
             return final_value, Credentials(
                 token=result["token"],
@@ -341,43 +779,62 @@ class Database:
                 client_id=result["client_id"],
                 client_secret=result["client_secret"],
                 scopes=result["scopes"].split(","),
+                expiry=datetime.fromisoformat(result["token_expiry"]) if result["token_expiry"] else None,
             )
         except Exception as e:
             print(f"Database error: {e}")
-            conn.close()
+            self._release(conn)
             return None, None
     
+    #Update Tokens in Gmail after the client library refreshed them
+    def update_tokens_for_gmail(self, email, token, refresh_token, token_expiry):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                UPDATE oauth_credentials_for_gmail SET token = ?, refresh_token = ?, token_expiry = ? WHERE email = ?
+            """, (token, refresh_token, token_expiry.isoformat() if token_expiry else None, email,))
+            conn.commit()
+            return {"message": "Successfully Updated."}, 200
+        except Exception as e:
+            return {"error": f"Error Occured. {e}"}, 400
+        finally:
+            self._release(conn)
+
     # Retrieve credentials for Outlook
     def get_credentials_from_db_for_outlook(self, email):
-        conn = sqlite3.connect(self.db_name)
+        conn = self._connect()
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT delivery_score, access_token, refresh_token, client_id, client_secret, scopes FROM oauth_credentials_for_outlook WHERE email = ? AND status = 'enabled'
+            SELECT delivery_score, access_token, refresh_token, client_id, client_secret, scopes, token_expires_at FROM oauth_credentials_for_outlook WHERE email = ? AND status = 'enabled'
         """, (email,))
         result = cursor.fetchone()
-        conn.close()
+        self._release(conn)
         if result:
             return result
         else:
             return None
     
-    #Update Tokens in Outlook
-    def update_tokens_for_outlook(self, email, delivery_score, access_token, refresh_token):
+    #Update Tokens in Outlook; a delivery_score of None leaves the score unchanged
+    def update_tokens_for_outlook(self, email, delivery_score, access_token, refresh_token, token_expires_at=None):
+        conn = self._connect()
         try:
-            conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
             cursor.execute("""
-                UPDATE oauth_credentials_for_outlook SET delivery_score = ?, access_token = ?, refresh_token = ? WHERE email=?
-            """, (delivery_score, access_token, refresh_token, email,))
+                UPDATE oauth_credentials_for_outlook
+                SET delivery_score = COALESCE(?, delivery_score), access_token = ?, refresh_token = ?, token_expires_at = ?
+                WHERE email=?
+            """, (delivery_score, access_token, refresh_token, token_expires_at, email,))
             conn.commit()
-            conn.close()
             return {"message": "Successfully Updated."}, 200
         except Exception as e:
             return {"error": f"Error Occured. {e}"}, 400
-    
+        finally:
+            self._release(conn)
+
     def delete_user(self, user_id):
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._connect()
             query = "DELETE FROM users WHERE id = ?;"
             cursor = conn.cursor()
             cursor.execute(query, (user_id,))
@@ -390,11 +847,11 @@ class Database:
         except Exception as e:
             return {"error": f"Error Occured. {e}"}, 400
         finally:
-            conn.close()
+            self._release(conn)
     
     def update_user_status(self, user_id, status):
         try:
-            conn = sqlite3.connect(self.db_name)
+            conn = self._connect()
             query = "UPDATE users SET status = ? WHERE id = ?;"
             cursor = conn.cursor()
             cursor.execute(query, (status, user_id))
@@ -407,29 +864,31 @@ class Database:
         except Exception as e:
             return {"error": f"Error Occurred. {e}"}, 400
         finally:
-            conn.close()
+            self._release(conn)
         
     def create_email_template(self, name, subject, body):
+        conn = self._connect()
         try:
-            conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
             cursor.execute("""
             INSERT INTO email_templates (name, subject, body)
             VALUES (?, ?, ?)
             """, (name, subject, body))
             conn.commit()
-            conn.close()
+            self._invalidate_templates()
             return {"message": "Template created successfully!"}, 200
         except Exception as e:
             return {"error": str(e)}, 500
-        
+        finally:
+            self._release(conn)
+
     def delete_email_template(self, template_id):
+        conn = self._connect()
         try:
-            conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
             cursor.execute("DELETE FROM email_templates WHERE id = ?", (template_id,))
             conn.commit()
-            conn.close()
+            self._invalidate_templates()
 
             if cursor.rowcount == 0:
                 return {"error": "Template not found!"}, 404
@@ -437,10 +896,12 @@ class Database:
             return {"message": "Template deleted successfully!"}, 200
         except Exception as e:
             return {"error": str(e)}, 500
-    
+        finally:
+            self._release(conn)
+
     def update_email_template(self, template_id, subject, body):
+        conn = self._connect()
         try:
-            conn = sqlite3.connect(self.db_name)
             cursor = conn.cursor()
             query = "UPDATE email_templates SET timestamp = CURRENT_TIMESTAMP"
             params = []
@@ -456,7 +917,7 @@ class Database:
 
             cursor.execute(query, tuple(params))
             conn.commit()
-            conn.close()
+            self._invalidate_templates()
 
             if cursor.rowcount == 0:
                 return {"error": "Template not found!"}, 404
@@ -464,20 +925,393 @@ class Database:
             return {"message": "Template updated successfully!"}, 200
         except Exception as e:
             return {"error": str(e)}, 500
-        
+        finally:
+            self._release(conn)
+
+    # All templates, served from an in-process cache.
+    # The cache is dropped by the template write methods here and reloaded whenever another
+    # process has bumped the email_templates version.
     def get_email_templates(self):
+        conn = self._connect()
         try:
-            conn = sqlite3.connect(self.db_name)
-            conn.row_factory = sqlite3.Row  # Enables dictionary-like access
+            version = self.get_templates_version()
+            with self._templates_lock:
+                if self._templates_cache and self._templates_cache[0] == version:
+                    return self._templates_cache[1]
+
             cursor = conn.cursor()
 
             cursor.execute("SELECT id, name, subject, body FROM email_templates")
             templates = [dict(row) for row in cursor.fetchall()]
 
-            conn.close()
+            with self._templates_lock:
+                self._templates_cache = (version, templates)
             return templates
         except Exception as e:
             return {f"Database error: {e}"}, 500
+        finally:
+            self._release(conn)
+
+    # One page of templates ordered by id, optionally only those whose name starts with name_prefix
+    def get_email_templates_page(self, name_prefix=None, summary=False, after=None, limit=50):
+        filters, params = [], []
+        self._add_prefix_filter(filters, params, "name", name_prefix)
+        columns = "id, name, subject" if summary else "id, name, subject, body"
+        conn = self._connect()
+        try:
+            return self._keyset_page(conn.cursor(), f"SELECT {columns} FROM email_templates", filters, params, ("id",), after, limit)
+        finally:
+            self._release(conn)
+
+    # Template list without bodies
+    def get_email_template_summaries(self):
+        return [{"id": t["id"], "name": t["name"], "subject": t["subject"]} for t in self.get_email_templates()]
+
+    def get_email_template(self, template_id):
+        return next((t for t in self.get_email_templates() if t["id"] == template_id), None)
+
+    # Current version of the email_templates table, used as the cache key and ETag
+    def get_templates_version(self):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT version FROM cache_versions WHERE name = 'email_templates'")
+        result = cursor.fetchone()
+        self._release(conn)
+        return result[0] if result else 0
+
+    def _invalidate_templates(self):
+        with self._templates_lock:
+            self._templates_cache = None
+
+    # Create a Campaign and Queue its Recipients in One Transaction
+    # recipients yields (recipient, sender_email, fields) rows, so a campaign can be sharded over several
+    # mailboxes and personalised per recipient
+    def create_campaign(self, sender_email, service, subject, body, cc, bcc, send_time, recipients, template_id=None):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO campaigns (sender_email, service, subject, body, cc, bcc, send_time, state, template_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (sender_email, service, subject, body, cc, bcc, send_time, "scheduled" if send_time else "running", template_id))
+            campaign_id = cursor.lastrowid
+            # Recipients may be any iterable; duplicates within a campaign are queued once
+            cursor.executemany(
+                "INSERT OR IGNORE INTO outbox (campaign_id, recipient, sender_email, fields) VALUES (?, ?, ?, ?)",
+                ((campaign_id, recipient, sender, fields) for recipient, sender, fields in recipients)
+            )
+            cursor.execute("UPDATE campaigns SET recipient_count = ? WHERE id = ?", (cursor.rowcount, campaign_id))
+            conn.commit()
+            return campaign_id
+        finally:
+            self._release(conn)
+
+    def get_campaign(self, campaign_id):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM campaigns WHERE id = ?", (campaign_id,))
+        result = cursor.fetchone()
+        self._release(conn)
+        return dict(result) if result else None
+
+    # Move a campaign to a new state, recording when it first started and when it finished
+    def set_campaign_state(self, campaign_id, state, error=None):
+        conn = self._connect()
+        conn.execute("""
+            UPDATE campaigns SET state = ?,
+                started_at = CASE WHEN ? = 'running' THEN COALESCE(started_at, CURRENT_TIMESTAMP) ELSE started_at END,
+                finished_at = CASE WHEN ? IN ('completed', 'failed') THEN CURRENT_TIMESTAMP ELSE NULL END,
+                last_error = COALESCE(?, last_error)
+            WHERE id = ?
+        """, (state, state, state, error, campaign_id))
+        conn.commit()
+        self._release(conn)
+
+    # Add one sent chunk's round trips to its campaign's totals
+    def add_campaign_round_trips(self, campaign_id, round_trips, round_trips_saved):
+        conn = self._connect()
+        conn.execute("""
+            UPDATE campaigns SET round_trips = round_trips + ?, round_trips_saved = round_trips_saved + ? WHERE id = ?
+        """, (round_trips, round_trips_saved, campaign_id))
+        conn.commit()
+        self._release(conn)
+
+    # Campaigns that were running or waiting for their send time when the process stopped
+    def get_unfinished_campaigns(self):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, state, send_time FROM campaigns WHERE state IN ('scheduled', 'running')")
+        campaigns = [dict(row) for row in cursor.fetchall()]
+        self._release(conn)
+        return campaigns
+
+    # Mailboxes that still have queued rows in a campaign
+    def get_campaign_senders(self, campaign_id):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT DISTINCT sender_email FROM outbox WHERE campaign_id = ? AND state IN ('queued', 'sending')
+        """, (campaign_id,))
+        senders = [row[0] for row in cursor.fetchall()]
+        self._release(conn)
+        return senders
+
+    # Atomically move up to limit queued outbox rows of one mailbox's shard to 'sending' and return them
+    def claim_outbox_rows(self, campaign_id, sender_email, limit):
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # Take the write lock so two workers never claim the same rows
+            rows = conn.execute("""
+                SELECT id, recipient, fields FROM outbox WHERE campaign_id = ? AND sender_email = ? AND state = 'queued' ORDER BY id LIMIT ?
+            """, (campaign_id, sender_email, limit)).fetchall()
+            conn.executemany(
+                "UPDATE outbox SET state = 'sending', claimed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                [(row[0],) for row in rows]
+            )
+            conn.commit()
+            return rows
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    # Checkpoint outbox rows; updates is a list of (state, outbox_id)
+    def update_outbox_rows(self, updates):
+        conn = self._connect()
+        try:
+            conn.executemany("UPDATE outbox SET state = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", updates)
+            conn.commit()
+        finally:
+            self._release(conn)
+
+    # Put rows claimed more than lease_seconds ago back in the queue; their worker is taken to have died.
+    # Rows claimed more recently may still be in flight in another process and are left alone.
+    def requeue_stale_outbox_rows(self, lease_seconds):
+        conn = self._connect()
+        cursor = conn.execute("""
+            UPDATE outbox SET state = 'queued', claimed_at = NULL
+            WHERE state = 'sending' AND claimed_at < datetime('now', ?)
+        """, (f"-{int(lease_seconds)} seconds",))
+        conn.commit()
+        self._release(conn)
+        return cursor.rowcount
+
+    # Return rows this worker claimed but did not send to the queue
+    def release_outbox_rows(self, outbox_ids):
+        conn = self._connect()
+        try:
+            conn.executemany(
+                "UPDATE outbox SET state = 'queued', claimed_at = NULL WHERE id = ? AND state = 'sending'",
+                [(outbox_id,) for outbox_id in outbox_ids]
+            )
+            conn.commit()
+        finally:
+            self._release(conn)
+
+    # Outbox counts per mailbox and state: {sender_email: {state: count}}
+    def get_outbox_counts_by_sender(self, campaign_id):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT sender_email, state, COUNT(*) FROM outbox WHERE campaign_id = ? GROUP BY sender_email, state
+        """, (campaign_id,))
+        counts = {}
+        for sender, state, count in cursor.fetchall():
+            counts.setdefault(sender, {})[state] = count
+        self._release(conn)
+        return counts
+
+    # Delivery figures of one campaign from its own status rows, named like the dashboard statistics
+    def get_campaign_delivery_counts(self, campaign_id):
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT status, COUNT(*) FROM email_status WHERE campaign_id = ? GROUP BY status", (campaign_id,))
+            counts = dict(cursor.fetchall())
+            return {
+                "sent_count": sum(counts.values()),
+                "delivered_count": counts.get("DELIVERED", 0),
+                "spammed_count": counts.get("SPAMMED", 0),
+                "failed_count": counts.get("FAILED", 0),
+                "inboxed_count": counts.get("INBOXED", 0),
+                "unknown_count": counts.get("UNKNOWN", 0),
+                "pending_count": counts.get("PENDING", 0)
+            }
+        finally:
+            self._release(conn)
+
+    # One page of campaigns, newest first
+    def get_campaigns_page(self, state=None, service=None, sender=None, after=None, limit=50):
+        filters, params = [], []
+        for column, value in (("state", state), ("service", service), ("sender_email", sender)):
+            if value:
+                filters.append(f"{column} = ?")
+                params.append(value)
+        conn = self._connect()
+        try:
+            return self._keyset_page(conn.cursor(), """
+                SELECT id, sender_email, service, subject, template_id, send_time, state, recipient_count,
+                    created_at, started_at, finished_at FROM campaigns
+            """, filters, params, ("id",), after, limit, descending=True)
+        finally:
+            self._release(conn)
+
+    # One page of a campaign's recipients by address, optionally narrowed to a queue state.
+    # Ordered by the outbox's (campaign_id, recipient) key, so no page needs a sort.
+    def get_campaign_recipients_page(self, campaign_id, state=None, after=None, limit=50):
+        filters, params = ["campaign_id = ?"], [campaign_id]
+        if state:
+            filters.append("state = ?")
+            params.append(state)
+        conn = self._connect()
+        try:
+            return self._keyset_page(conn.cursor(), """
+                SELECT id, recipient, sender_email, state, updated_at, delivery_status, message_id FROM campaign_recipients
+            """, filters, params, ("recipient",), after, limit)
+        finally:
+            self._release(conn)
 
+    def get_outbox_counts(self, campaign_id):
+        conn = self._connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT state, COUNT(*) FROM outbox WHERE campaign_id = ? GROUP BY state", (campaign_id,))
+        counts = dict(cursor.fetchall())
+        self._release(conn)
+        return counts
+
+    # Enabled mailboxes of a service with their delivery score, lifetime sends and sends in the last day
+    def get_mailbox_pool(self, service, emails):
+        table = "oauth_credentials_for_outlook" if service == "outlook" else "oauth_credentials_for_gmail"
+        conn = self._connect()
+        try:
+            cursor = conn.cursor()
+            pool = []
+            for email in emails:
+                cursor.execute(f"SELECT delivery_score FROM {table} WHERE email = ? AND status = 'enabled'", (email,))
+                row = cursor.fetchone()
+                if not row:
+                    continue
+                cursor.execute("""
+                    SELECT COALESCE(SUM(count), 0) FROM email_status_counters WHERE service = ? AND sender = ?
+                """, (service, email))
+                sent_total = cursor.fetchone()[0]
+                cursor.execute("""
+                    SELECT COUNT(*) FROM email_status WHERE sender = ? AND service = ? AND timestamp >= datetime('now', '-1 day')
+                """, (email, service))
+                pool.append({
+                    "email": email,
+                    "delivery_score": row[0] or 0,
+                    "sent_total": sent_total,
+                    "sent_today": cursor.fetchone()[0]
+                })
+            return pool
+        finally:
+            self._release(conn)
+
+    # Batched writer for email_status rows (see EmailStatusWriter)
+    def status_writer(self, max_rows=500, max_delay=1.0, campaign_id=None):
+        return EmailStatusWriter(self, max_rows, max_delay, campaign_id)
+
+    # Close every connection opened by any thread; later calls open new ones
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        # Replacing the thread-local storage releases this thread's holder, which may close its connection at once
+        self._local = threading.local()
+        with self._connections_lock:
+            connections = list(self._connections)
+        for conn in connections:
+            self._close_connection(conn)
+
+# Buffers email_status rows and outbox checkpoints and writes them with executemany in one transaction.
+# A flush happens once max_rows rows are buffered, from a timer max_delay seconds after a row arrives in an
+# empty buffer, and on close(); writers still open at interpreter exit are flushed too.
+# Rows stay buffered until their transaction commits, so a failed write is retried by the next flush.
+# Rows written for a campaign carry its id.
+class EmailStatusWriter:
+    def __init__(self, db, max_rows=500, max_delay=1.0, campaign_id=None):
+        self.db = db
+        self.campaign_id = campaign_id
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self._rows = []
+        self._outbox_updates = []
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.close)
+
+    # An outbox_update of (state, outbox_id) is the row's checkpoint. It is added under the same lock as the
+    # row, so no flush can commit one without the other.
+    def add(self, recipient, service, message_id, status, sender=None, outbox_update=None):
+        with self._lock:
+            self._rows.append((recipient, service, message_id, status, sender, self.campaign_id))
+            if outbox_update:
+                self._outbox_updates.append(outbox_update)
+            self._start_timer()
+        self._maybe_flush()
+
+    # Outbox checkpoint of a recipient that has no status row, such as one going back in the queue
+    def add_outbox_update(self, state, outbox_id):
+        with self._lock:
+            self._outbox_updates.append((state, outbox_id))
+            self._start_timer()
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        if len(self._rows) + len(self._outbox_updates) >= self.max_rows:
+            self.flush()
+
+    # Called with the lock held
+    def _start_timer(self):
+        if self._timer is None:
+            self._timer = threading.Timer(self.max_delay, self._timed_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Error writing email statuses, retrying: {e}")
+            with self._lock:
+                self._start_timer()
+
+    def flush(self):
+        with self._lock:
+            if not self._rows and not self._outbox_updates:
+                return
+            conn = self.db._connect()
+            try:
+                with conn:  # One transaction, one commit, for the whole batch
+                    conn.executemany("""
+                        INSERT INTO email_status (recipient, service, message_id, status, sender, campaign_id)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    """, self._rows)
+                    conn.executemany("UPDATE outbox SET state = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?", self._outbox_updates)
+                self._rows = []
+                self._outbox_updates = []
+            finally:
+                self.db._release(conn)
+
+    def close(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+        self.flush()
+        atexit.unregister(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# Recompute the dashboard counters from raw history: python database.py rebuild-counters
+# It runs without importing app.py, so it starts no scheduler and resumes no campaigns while the server is down.
+if __name__ == "__main__":
+    if sys.argv[1:] != ["rebuild-counters"]:
+        sys.exit("Usage: python database.py rebuild-counters")
+    Database().rebuild_counters()
+    print("Email status counters rebuilt.")
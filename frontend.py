@@ -1,14 +1,14 @@
 import streamlit as st
-import requests
 import time
 import pandas as pd
 import altair as alt
 import plotly.express as px
 import pathlib
 import re
-
-# Flask API URL
-API_URL = "https://mass-mailer.onrender.com"
+from frontend_common import (
+    API_URL, api_session, fetch_dashboard_statistics, clear_dashboard_cache, fetch_template_list, fetch_template,
+    show_trend_chart, show_last_campaign
+)
 
 # Define functions to handle each page's content
 def show_home_page():
@@ -99,7 +99,7 @@ def show_register_page():
 
         # Proceed with registration if no errors
         if not email_error and not password_error and username:
-            response = requests.post(f"{API_URL}/register", json={
+            response = api_session().post(f"{API_URL}/register", json={
                 "username": username,
                 "status": "enabled",
                 "email": email,
@@ -162,7 +162,7 @@ def show_login_page():
     # Login action
     if submit_button:
         if email and password:
-            response = requests.post(f"{API_URL}/login", json={
+            response = api_session().post(f"{API_URL}/login", json={
                 "email": email,
                 "password": password,
                 "role": 0,
@@ -187,12 +187,13 @@ def show_send_mass_mail_page():
         # Email service selection
         send_option = st.selectbox("Choose Email Service", ["Select", "Gmail", "Outlook"], key="service")
         email = st.text_input("Sender Email")
+        # More verified mailboxes to share the send with, weighted by delivery score and remaining daily quota
+        extra_senders = st.text_input("Additional Sender Emails to Share the Send [Give Comma-Seperated Values] (Optional)", value="", key="extra_senders")
 
         # Fetch email templates from the API
         try:
-            template_response = requests.get(f"{API_URL}/get_templates")
-            if template_response.status_code == 200:
-                templates = template_response.json()  # List of templates
+            templates = fetch_template_list()  # List of templates without bodies
+            if templates is not None:
                 template_names = ["None"] + [template["name"] for template in templates]
             else:
                 templates = []
@@ -208,23 +209,27 @@ def show_send_mass_mail_page():
         default_body = ""
 
         # Template selection logic
+        template_id = None
         selected_template_name = st.selectbox("Choose a Template (Optional)", template_names)
         if selected_template_name != "None":
             selected_template = next((template for template in templates if template["name"] == selected_template_name), None)
             if selected_template:
+                template_id = selected_template["id"]
+                # Bodies are only downloaded for the selected template
+                selected_template = fetch_template(selected_template["id"]) or selected_template
                 default_subject = selected_template.get("subject", "")
                 default_body = selected_template.get("body", "")
 
         # Subject and Body with editable fields
         subject = st.text_input("Email Subject", value=default_subject, key="subject")
-        body = st.text_area("Email Body", value=default_body, key="body")
+        body = st.text_area("Email Body", value=default_body, key="body", help="Use {{column}} to fill in a value from an extra CSV column, e.g. {{first_name}}")
 
         # CC and BCC fields
         cc = st.text_area("CC [Give Comma-Seperated Values] (Optional)", value="", key="cc")
         bcc = st.text_area("BCC [Give Comma-Seperated Values] (Optional)", value="", key="bcc")
 
         # File uploader for CSV
-        csv_file = st.file_uploader("Recipient Emails - Upload CSV file", type="csv")
+        csv_file = st.file_uploader("Recipient Emails - Upload CSV file", type=["csv", "gz"])
 
         # Select Date and Time (shown above the buttons)
         selected_date = st.date_input("Select Date (Optional)", value=pd.to_datetime("today").date(), key="date_option")
@@ -268,20 +273,28 @@ def show_send_mass_mail_page():
                         "cc": cc,
                         "bcc": bcc
                     }
+                    if extra_senders.strip():
+                        data["sender_pool"] = f"{email},{extra_senders}"
+                    if template_id:
+                        data["template_id"] = template_id
 
                     # Make the API request to send the mail
-                    response = requests.post(
+                    response = api_session().post(
                         f"{API_URL}/send_mass_mail",
                         data=data,
                         files=files
                     )
 
-                    if response.status_code == 200:
-                        st.success("Emails sent successfully!")
-                        time.sleep(1)
-                        st.rerun()  # Reload the page to show updated status
-                    elif response.status_code == 202:
-                        st.success("Email Scheduled Successfully!")
+                    if response.status_code == 202:
+                        # The send runs in the background; follow it through /campaigns/<id>
+                        result = response.json()
+                        st.session_state.campaign_id = result["campaign_id"]
+                        st.session_state.pop("campaign_progress", None)
+                        clear_dashboard_cache()
+                        if result.get("state") == "scheduled":
+                            st.success("Email Scheduled Successfully!")
+                        else:
+                            st.success("Sending started!")
                         time.sleep(1)
                         st.rerun()
                     elif response.status_code == 403:
@@ -295,6 +308,8 @@ def show_send_mass_mail_page():
                     st.error(f"An error occurred: {e}")
             else:
                 st.warning("Please fill in all required fields.")
+
+        show_last_campaign()
     else:
         st.warning("Please log in to access the Send Mass Mail Page.")
 
@@ -302,9 +317,8 @@ def show_send_mass_mail_page():
 def show_dashboard_page():
     if st.session_state.logged_in:
         st.subheader("Dashboard")
-        response = requests.get(f"{API_URL}/dashboard_statistics")
-        if response.status_code == 200:
-            stats = response.json()
+        stats = fetch_dashboard_statistics()
+        if stats is not None:
             try:
                 sent_count = stats.get('sent_count')
                 delivered_count = stats.get('delivered_count')
@@ -354,6 +368,12 @@ def show_dashboard_page():
             st.write(f"Total Emails Successfully Delivered: {stats.get('delivered_count', 'N/A')}")
             st.write(f"Total Emails Spammed: {stats.get('spammed_count', 'N/A')}")
             st.write(f"Total Emails Failed: {stats.get('failed_count', 'N/A')}")
+            st.write(f"Total Emails Inboxed: {stats.get('inboxed_count', 'N/A')}")
+            st.write(f"Total Emails Awaiting Status: {stats.get('pending_count', 'N/A')}")
+            st.write(f"Total Emails With Unknown Status: {stats.get('unknown_count', 'N/A')}")
+
+            st.write("### Trend")
+            show_trend_chart()
         else:
             st.error("Failed to load dashboard data.")
     else:
@@ -0,0 +1,135 @@
+import streamlit as st
+import requests
+from http.cookiejar import DefaultCookiePolicy
+import pandas as pd
+
+# Helpers shared by the user app (frontend.py) and the admin app (super_user.py)
+
+# Flask API URL
+API_URL = "https://mass-mailer.onrender.com"
+
+# Seconds cached loads are reused before they are read again; actions on a page clear its loaders at once
+ADMIN_CACHE_TTL = 60
+STATS_CACHE_TTL = 30
+# Seconds between progress checks of a campaign sending in the background
+CAMPAIGN_POLL_SECONDS = 5
+
+# One keep-alive HTTP session to the API, shared by every rerun and every user of this app.
+# It keeps no cookies, so nothing one user's requests set can leak into another's.
+@st.cache_resource
+def api_session():
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+# Cached loaders whose data a send changes, by name; clear_dashboard_cache clears them all.
+# Keyed by name so an app that registers a loader on every rerun keeps a single entry for it.
+dashboard_loaders = {}
+
+def dashboard_loader(loader):
+    dashboard_loaders[loader.__qualname__] = loader
+    return loader
+
+# Dashboard loaders; each returns the parsed response, or None when the request failed
+@dashboard_loader
+@st.cache_data(ttl=STATS_CACHE_TTL, show_spinner=False)
+def fetch_dashboard_statistics():
+    response = api_session().get(f"{API_URL}/dashboard_statistics")
+    return response.json() if response.status_code == 200 else None
+
+@dashboard_loader
+@st.cache_data(ttl=STATS_CACHE_TTL, show_spinner=False)
+def fetch_timeseries(granularity):
+    response = api_session().get(f"{API_URL}/stats/timeseries", params={"granularity": granularity, "group_by": "total"})
+    return response.json() if response.status_code == 200 else None
+
+# Sending changes every dashboard number
+def clear_dashboard_cache():
+    for loader in dashboard_loaders.values():
+        loader.clear()
+
+# Fetch the template list without bodies, reusing the last copy while the server answers 304 Not Modified
+def fetch_template_list():
+    cached = st.session_state.get("template_list")
+    headers = {"If-None-Match": cached["etag"]} if cached else {}
+    response = api_session().get(f"{API_URL}/get_templates", params={"fields": "summary"}, headers=headers)
+    if response.status_code == 304 and cached:
+        return cached["templates"]
+    if response.status_code == 200:
+        templates = response.json()
+        st.session_state.template_list = {"etag": response.headers.get("ETag", ""), "templates": templates}
+        return templates
+    return None
+
+# Fetch one template with its body, only when it is selected
+def fetch_template(template_id):
+    cache = st.session_state.setdefault("template_bodies", {})
+    cached = cache.get(template_id)
+    headers = {"If-None-Match": cached["etag"]} if cached else {}
+    response = api_session().get(f"{API_URL}/get_template/{template_id}", headers=headers)
+    if response.status_code == 304 and cached:
+        return cached["template"]
+    if response.status_code == 200:
+        template = response.json()
+        cache[template_id] = {"etag": response.headers.get("ETag", ""), "template": template}
+        return template
+    return None
+
+# Chart sent, delivered, spammed and failed counts over time from the server's rollups
+def show_trend_chart():
+    granularity = st.radio("Trend", ["day", "hour"], format_func=lambda g: "Last 30 days" if g == "day" else "Last 48 hours", horizontal=True, key="trend_granularity")
+    series = fetch_timeseries(granularity)
+    if series is None:
+        st.error("Failed to load trend data.")
+        return
+    buckets = series["buckets"]
+    if not buckets:
+        st.info("No emails sent in this period.")
+        return
+    df = pd.DataFrame(buckets)
+    df["bucket"] = pd.to_datetime(df["bucket"])
+    st.line_chart(df.set_index("bucket")[["sent", "delivered", "spammed", "failed"]])
+
+# Counts, rate and ETA of a campaign as reported by /campaigns/<id>
+def show_campaign_summary(progress):
+    state = progress["state"]
+    st.subheader(f"Campaign {progress['campaign_id']}: {state.capitalize()}")
+    if state == "scheduled":
+        st.info(f"Scheduled for {progress['send_time']}")
+    st.progress(min(int(progress["progress"]), 100))
+    counts = progress["counts"]
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Sent", counts.get("sent", 0))
+    col2.metric("Failed", counts.get("failed", 0))
+    col3.metric("Queued", counts.get("queued", 0) + counts.get("sending", 0))
+    col4.metric("Total", progress["total"])
+    if progress["rate_per_second"]:
+        eta = f", about {int(progress['eta_seconds'])}s left" if progress["eta_seconds"] is not None else ""
+        st.caption(f"{progress['rate_per_second'] * 60:.1f} emails/minute{eta}")
+    if progress["errors"]["last_error"]:
+        st.error(f"Last error: {progress['errors']['last_error']}")
+
+# Poll the campaign started from this page until it finishes; the fragment reruns on its own, not the whole page
+@st.fragment(run_every=CAMPAIGN_POLL_SECONDS)
+def show_campaign_progress():
+    response = api_session().get(f"{API_URL}/campaigns/{st.session_state.campaign_id}")
+    if response.status_code != 200:
+        st.warning(f"Could not load campaign progress: {response.text}")
+        return
+    progress = response.json()
+    if progress["state"] in ("completed", "failed"):
+        # Keep the final numbers and rerun the page once so polling stops
+        st.session_state.campaign_progress = progress
+        clear_dashboard_cache()
+        st.rerun()
+    show_campaign_summary(progress)
+
+# The last campaign sent from this page: live progress while it runs, its final numbers after
+def show_last_campaign():
+    if "campaign_id" not in st.session_state:
+        return
+    final = st.session_state.get("campaign_progress")
+    if final and final["campaign_id"] == st.session_state.campaign_id:
+        show_campaign_summary(final)
+    else:
+        show_campaign_progress()
@@ -0,0 +1,46 @@
+import os
+from http.cookiejar import DefaultCookiePolicy
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Microsoft Graph HTTP client configuration
+GRAPH_POOL_SIZE = int(os.environ.get("GRAPH_POOL_SIZE", 16))  # Keep-alive connections kept per host
+GRAPH_CONNECT_TIMEOUT = float(os.environ.get("GRAPH_CONNECT_TIMEOUT", 5))  # Seconds
+GRAPH_READ_TIMEOUT = float(os.environ.get("GRAPH_READ_TIMEOUT", 30))  # Seconds
+GRAPH_RETRIES = int(os.environ.get("GRAPH_RETRIES", 3))
+
+# Session that applies a default timeout to every request
+class TimeoutSession(requests.Session):
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+# Create a pooled keep-alive session with retries.
+# Status retries only apply to idempotent methods, so a POST such as sendMail is never sent twice;
+# connection errors are retried for every method because the request never reached the server.
+def create_session(pool_size, timeout, retries):
+    session = TimeoutSession(timeout)
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,
+        status=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # No shared cookie state between the threads using this session
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+# Shared by every Graph and Microsoft login call; urllib3 pools are safe to use from many threads
+graph_session = create_session(GRAPH_POOL_SIZE, (GRAPH_CONNECT_TIMEOUT, GRAPH_READ_TIMEOUT), GRAPH_RETRIES)
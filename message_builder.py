@@ -0,0 +1,40 @@
+import base64
+from email.mime.text import MIMEText
+
+# Create Message for Gmail
+def create_message(sender, to, subject, body, cc="", bcc=""):
+    message = MIMEText(body)
+    message["to"] = to
+    message["from"] = sender
+    message["subject"] = subject
+    if cc:
+        message["cc"] = cc
+    if bcc:
+        message["bcc"] = bcc
+    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode("utf-8")
+    return {"raw": raw_message}
+
+# A message whose body and shared headers are serialised and base64-encoded once, for a campaign that sends
+# the same content to everyone. Only the To header differs per recipient; it is put in front of the skeleton
+# and padded with spaces after the colon to a multiple of 3 bytes, so its base64 can simply be joined to the
+# skeleton's without re-encoding anything else.
+class MessageSkeleton:
+    def __init__(self, sender, subject, body, cc="", bcc=""):
+        self.args = (sender, subject, body, cc, bcc)
+        message = MIMEText(body)
+        message["from"] = sender
+        message["subject"] = subject
+        if cc:
+            message["cc"] = cc
+        if bcc:
+            message["bcc"] = bcc
+        self.encoded = base64.urlsafe_b64encode(message.as_bytes()).decode("ascii")
+
+    def create_message(self, to):
+        # Addresses that would need encoding or folding take the regular path
+        if not to.isascii() or len(to) > 900 or "\r" in to or "\n" in to:
+            sender, subject, body, cc, bcc = self.args
+            return create_message(sender, to, subject, body, cc, bcc)
+        header = f"to: {to}\n"
+        header = header.replace(":", ":" + " " * (-len(header) % 3), 1)
+        return {"raw": base64.urlsafe_b64encode(header.encode("ascii")).decode("ascii") + self.encoded}
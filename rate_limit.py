@@ -0,0 +1,111 @@
+import os
+import random
+import threading
+import time
+
+# Default send quotas per mailbox, in messages per second.
+# Gmail grants 250 quota units per user per second and messages.send costs 100 of them;
+# Exchange Online accepts 30 messages per minute from one mailbox.
+PROVIDER_RATES = {
+    "gmail": float(os.environ.get("GMAIL_SEND_RATE", 2.5)),
+    "outlook": float(os.environ.get("OUTLOOK_SEND_RATE", 0.5)),
+}
+# Default messages one mailbox may send per day
+PROVIDER_DAILY_QUOTAS = {
+    "gmail": int(os.environ.get("GMAIL_DAILY_QUOTA", 500)),
+    "outlook": int(os.environ.get("OUTLOOK_DAILY_QUOTA", 10000)),
+}
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", 5))  # Tokens an idle bucket can bank
+RATE_LIMIT_DECREASE = 0.5  # Rate multiplier applied on every throttled response
+RATE_LIMIT_RECOVERY = 0.02  # Fraction of the provider rate regained per successful send
+RATE_LIMIT_MIN_FRACTION = 0.1  # The rate never drops below this fraction of the provider rate
+RATE_LIMIT_MAX_BACKOFF = 300  # Seconds
+RATE_LIMIT_JITTER = 0.25  # Up to this fraction is added to every backoff so workers do not retry in step
+RATE_LIMIT_RETRIES = int(os.environ.get("RATE_LIMIT_RETRIES", 3))  # Retries of a throttled or transiently failing send; a throttled recipient is then requeued, others fail
+
+# Token bucket that adapts its rate to the provider's responses.
+# Every throttled response halves the rate and pauses the bucket, and every success adds a little back,
+# so a mailbox settles just under the rate the provider actually accepts.
+# A caller may take more tokens than are banked; it then waits until the debt is refilled.
+class TokenBucket:
+    def __init__(self, rate, burst=RATE_LIMIT_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self.throttle_streak = 0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    # Take count tokens, sleeping until they are available. Returns the seconds waited.
+    def acquire(self, count=1):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= count
+            # Refill resumes at self.updated, which lies ahead of now while the bucket is paused
+            wait = max(self.updated - now, 0) + max(-self.tokens, 0) / self.rate
+        if wait:
+            time.sleep(wait)
+        # A throttled response may have paused the bucket while this caller slept
+        waited = wait
+        while True:
+            pause = self.pause_remaining()
+            if not pause:
+                return waited
+            time.sleep(pause)
+            waited += pause
+
+    def success(self, count=1):
+        with self.lock:
+            self.throttle_streak = 0
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_LIMIT_RECOVERY * count)
+
+    # Slow down after a throttled response, pausing for retry_after seconds when the provider sent one
+    # and for an exponential backoff otherwise. Returns the pause in seconds.
+    def throttle(self, retry_after=None):
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.rate * RATE_LIMIT_DECREASE, self.max_rate * RATE_LIMIT_MIN_FRACTION)
+            if retry_after is None:
+                retry_after = min(2 ** self.throttle_streak / self.rate, RATE_LIMIT_MAX_BACKOFF)
+            self.throttle_streak += 1
+            delay = retry_after * (1 + random.uniform(0, RATE_LIMIT_JITTER))
+            self.paused_until = max(self.paused_until, now + delay)
+            # Nothing banked before the pause may be spent the moment it ends
+            self.tokens = min(self.tokens, 0)
+            self.updated = self.paused_until
+            return delay
+
+    # Seconds until the bucket accepts requests again
+    def pause_remaining(self):
+        with self.lock:
+            return max(self.paused_until - time.monotonic(), 0)
+
+limiters = {}
+limiters_lock = threading.Lock()
+
+# The shared bucket of one mailbox, created with the provider's default rate
+def get_limiter(service, mailbox):
+    key = (service, mailbox)
+    with limiters_lock:
+        if key not in limiters:
+            limiters[key] = TokenBucket(PROVIDER_RATES[service])
+        return limiters[key]
+
+# Seconds from a Retry-After header given in seconds, or None when there is none
+def parse_retry_after(headers):
+    for name, value in (headers or {}).items():
+        if name.lower() == "retry-after":
+            try:
+                return max(float(value), 0)
+            except ValueError:
+                return None
+    return None
@@ -1,43 +1,79 @@
 import streamlit as st
-import requests
 import pandas as pd
 import time
 import sqlite3
 import pathlib
 import plotly.graph_objects as go
-
-# Flask API URL
-API_URL = "https://mass-mailer.onrender.com"
-
-# Function to fetch users and return as a Pandas DataFrame
-def fetch_users():
-    conn = sqlite3.connect('email_management.db')
-    query = "SELECT * FROM users;"  # Query to fetch all data from the users table
-    df = pd.read_sql(query, conn)  # Execute the query and return the result as a DataFrame
-    conn.close()
-    return df
-
-# Function to fetch email templates and return as a Pandas DataFrame
-def fetch_email_templates():
-    conn = sqlite3.connect('email_management.db')
-    query = "SELECT * FROM email_templates;"  # Query to fetch all data from the email_templates table
-    df = pd.read_sql(query, conn)  # Execute the query and return the result as a DataFrame
-    conn.close()
-    return df
-
-def fetch_verified_gmails():
+from frontend_common import (
+    API_URL, ADMIN_CACHE_TTL, STATS_CACHE_TTL, api_session, dashboard_loader, fetch_dashboard_statistics,
+    clear_dashboard_cache, fetch_template_list, fetch_template, show_trend_chart, show_last_campaign
+)
+
+# Rows shown per page in the admin tables
+PAGE_SIZE = 50
+
+# One page of connected mailboxes; a send changes their counts, so clear_dashboard_cache clears it too
+@dashboard_loader
+@st.cache_data(ttl=STATS_CACHE_TTL, show_spinner=False)
+def fetch_mailboxes(cursor=None):
+    response = api_session().get(f"{API_URL}/oauth_emails", params={"limit": PAGE_SIZE, "cursor": cursor})
+    return response.json() if response.status_code == 200 else None
+
+# Fetch one page of a table ordered by its unique key column, starting after the key of the previous page's
+# last row, so every page is an index range scan however far in the table it is.
+# Returns the page as a Pandas DataFrame and the key to pass for the next page (None on the last page).
+def fetch_page(query, key, after=None):
     conn = sqlite3.connect('email_management.db')
-    query = "SELECT email, status FROM oauth_credentials_for_gmail;"
-    df = pd.read_sql(query, conn)
+    params = ()
+    if after is not None:
+        query += f" WHERE {key} > ?"
+        params = (after,)
+    query += f" ORDER BY {key} LIMIT ?"
+    df = pd.read_sql(query, conn, params=(*params, PAGE_SIZE + 1))  # One extra row tells if there is a next page
     conn.close()
-    return df
-
-def fetch_verified_outlook():
-    conn = sqlite3.connect('email_management.db')
-    query = "SELECT email, status FROM oauth_credentials_for_outlook;"
-    df = pd.read_sql(query, conn)
-    conn.close()
-    return df
+    next_after = df[key].tolist()[PAGE_SIZE - 1] if len(df) > PAGE_SIZE else None
+    return df.head(PAGE_SIZE), next_after
+
+# Function to fetch a page of users; password hashes are never loaded
+@st.cache_data(ttl=ADMIN_CACHE_TTL, show_spinner=False)
+def fetch_users(after=None):
+    return fetch_page("SELECT id, username, email, status, role FROM users", "id", after)
+
+# Function to fetch a page of email templates
+@st.cache_data(ttl=ADMIN_CACHE_TTL, show_spinner=False)
+def fetch_email_templates(after=None):
+    return fetch_page("SELECT id, name, subject, body, timestamp FROM email_templates", "id", after)
+
+@st.cache_data(ttl=ADMIN_CACHE_TTL, show_spinner=False)
+def fetch_verified_gmails(after=None):
+    return fetch_page("SELECT email, status FROM oauth_credentials_for_gmail", "email", after)
+
+@st.cache_data(ttl=ADMIN_CACHE_TTL, show_spinner=False)
+def fetch_verified_outlook(after=None):
+    return fetch_page("SELECT email, status FROM oauth_credentials_for_outlook", "email", after)
+
+# Show a table one page at a time with Previous / Next buttons; fetch(after) returns (DataFrame, next_after).
+# The keys of the pages seen so far are kept in the session so Previous can step back.
+def show_paged_table(title, key, fetch):
+    cursors = st.session_state.setdefault(f"{key}_cursors", [None])
+    df, next_after = fetch(cursors[-1])
+    if df.empty and len(cursors) == 1:
+        return
+    st.subheader(title)
+    st.dataframe(df)
+    show_page_buttons(key, cursors, next_after)
+
+# Previous / Next buttons over a list of the cursors of the pages seen so far
+def show_page_buttons(key, cursors, next_cursor):
+    col1, col2 = st.columns(2)
+    with col1:
+        if len(cursors) > 1 and st.button("Previous", key=f"{key}_previous"):
+            cursors.pop()
+            st.rerun()
+    with col2:
+        if next_cursor is not None and st.button("Next", key=f"{key}_next"):
+            cursors.append(next_cursor)
+            st.rerun()
 
 # Show Login Page
 def show_login_page():
@@ -58,7 +94,7 @@ def show_login_page():
     
     if submit_button:
         if email and password:
-            response = requests.post(f"{API_URL}/login", json={
+            response = api_session().post(f"{API_URL}/login", json={
                 "email": email,
                 "password": password,
                 "role": 1,
@@ -84,10 +120,7 @@ def manage_user_interface():
     tab1, tab2, tab3 = st.tabs(["Create User", "Delete User", "Enable/Disable User"])
 
     # Fetch and display users table in all tabs
-    users_df = fetch_users()
-    if not users_df.empty:
-        st.subheader("Users Table")
-        st.dataframe(users_df)  # Display users table in DataFrame format
+    show_paged_table("Users Table", "users", fetch_users)
 
     with tab1:
         st.header("Create New User")
@@ -102,7 +135,7 @@ def manage_user_interface():
             role = 0
         if st.button("Create User"):
             if username and email and password:
-                response = requests.post(f"{API_URL}/register", json={
+                response = api_session().post(f"{API_URL}/register", json={
                     "username": username,
                     "status": status.lower(),
                     "email": email,
@@ -110,6 +143,7 @@ def manage_user_interface():
                     "role": role
                 })
                 if response.status_code == 200:
+                    fetch_users.clear()
                     st.success("User created successfully!")
                     time.sleep(1)
                     st.rerun()
@@ -125,8 +159,9 @@ def manage_user_interface():
         user_id = st.text_input("User ID (Delete)")
         if st.button("Delete User"):
             if user_id:
-                response = requests.delete(f"{API_URL}/delete_user/{user_id}")
+                response = api_session().delete(f"{API_URL}/delete_user/{user_id}")
                 if response.status_code == 200:
+                    fetch_users.clear()
                     st.success("User deleted successfully!")
                     time.sleep(1)
                     st.rerun()
@@ -141,8 +176,9 @@ def manage_user_interface():
         status = st.selectbox("Status", ["Enabled", "Disabled"], key="endis")
         if st.button("Update User Status"):
             if user_id:
-                response = requests.put(f"{API_URL}/update_user_status/{user_id}", json={"status": status.lower()})
+                response = api_session().put(f"{API_URL}/update_user_status/{user_id}", json={"status": status.lower()})
                 if response.status_code == 200:
+                    fetch_users.clear()
                     st.success(f"User {status.lower()} successfully!")
                     time.sleep(1)
                     st.rerun()
@@ -204,10 +240,9 @@ def circular_gauge_html(value):
 def show_dashboard_page():
     if st.session_state.logged_in:
         st.title("Dashboard")
-        response = requests.get(f"{API_URL}/dashboard_statistics")
+        stats = fetch_dashboard_statistics()
 
-        if response.status_code == 200:
-            stats = response.json()
+        if stats is not None:
             try:
                 # Fetch statistics
                 delivered_count = stats.get('delivered_count')
@@ -307,12 +342,18 @@ def show_dashboard_page():
                 st.markdown(circular_gauge_html(deliverability_score), unsafe_allow_html=True)
 
                 st.markdown("<div style='margin-top: 20px;'></div>", unsafe_allow_html=True)
+
+                # Trend Section
+                st.markdown("### Trend")
+                show_trend_chart()
                 
                 # Email Management Section
                 st.markdown("### Mailbox Management")
-                email_response = requests.get(f"{API_URL}/oauth_emails")
-                if email_response.status_code == 200:
-                    emails = email_response.json()
+                mailbox_cursors = st.session_state.setdefault("mailbox_cursors", [None])
+                mailboxes = fetch_mailboxes(mailbox_cursors[-1])
+                if mailboxes is not None:
+                    emails = mailboxes["items"]
+                    next_cursor = mailboxes["next_cursor"]
                     if emails:
                         # Convert the email data to a DataFrame
                         email_data = []
@@ -329,6 +370,7 @@ def show_dashboard_page():
                         # Display the email data in a table
                         st.markdown("<style>table {margin-top: 20px;}</style>", unsafe_allow_html=True)
                         st.table(df)
+                        show_page_buttons("mailbox", mailbox_cursors, next_cursor)
                     else:
                         st.info("No email data available.")
                 else:
@@ -350,10 +392,7 @@ def email_templates_management():
     tab1, tab2, tab3 = st.tabs(["Create Template", "Update Template", "Delete Template"])
 
     # Fetch and display email templates in all tabs
-    templates_df = fetch_email_templates()
-    if not templates_df.empty:
-        st.subheader("Available Email Templates")
-        st.dataframe(templates_df)  # Display email templates in DataFrame format
+    show_paged_table("Available Email Templates", "templates", fetch_email_templates)
 
     with tab1:
         st.header("Create New Email Template")
@@ -363,12 +402,13 @@ def email_templates_management():
         
         if st.button("Create Template"):
             if template_name and subject and body:
-                response = requests.post(f"{API_URL}/create_template", json={
+                response = api_session().post(f"{API_URL}/create_template", json={
                     "name": template_name,
                     "subject": subject,
                     "body": body
                 })
                 if response.status_code == 200:
+                    fetch_email_templates.clear()
                     st.success("Template created successfully!")
                     time.sleep(1)
                     st.rerun()
@@ -385,11 +425,12 @@ def email_templates_management():
         
         if st.button("Update Template"):
             if template_id and new_subject or new_body:
-                response = requests.put(f"{API_URL}/update_template/{template_id}", json={
+                response = api_session().put(f"{API_URL}/update_template/{template_id}", json={
                     "subject": new_subject,
                     "body": new_body
                 })
                 if response.status_code == 200:
+                    fetch_email_templates.clear()
                     st.success("Template updated successfully!")
                     time.sleep(1)
                     st.rerun()
@@ -404,8 +445,9 @@ def email_templates_management():
         
         if st.button("Delete Template"):
             if template_id:
-                response = requests.delete(f"{API_URL}/delete_template/{template_id}")
+                response = api_session().delete(f"{API_URL}/delete_template/{template_id}")
                 if response.status_code == 200:
+                    fetch_email_templates.clear()
                     st.success("Template deleted successfully!")
                     time.sleep(1)
                     st.rerun()
@@ -421,12 +463,13 @@ def send_mass_mail_interface():
     # Email service selection
     send_option = st.selectbox("Choose Email Service", ["Select", "Gmail", "Outlook"], key="service")
     email = st.text_input("Sender Email")
+    # More verified mailboxes to share the send with, weighted by delivery score and remaining daily quota
+    extra_senders = st.text_input("Additional Sender Emails to Share the Send [Give Comma-Seperated Values] (Optional)", value="", key="extra_senders")
 
     # Fetch email templates from the API
     try:
-        template_response = requests.get(f"{API_URL}/get_templates")
-        if template_response.status_code == 200:
-            templates = template_response.json()  # List of templates
+        templates = fetch_template_list()  # List of templates without bodies
+        if templates is not None:
             template_names = ["None"] + [template["name"] for template in templates]
         else:
             templates = []
@@ -442,23 +485,27 @@ def send_mass_mail_interface():
     default_body = ""
 
     # Template selection logic
+    template_id = None
     selected_template_name = st.selectbox("Choose a Template (Optional)", template_names)
     if selected_template_name != "None":
         selected_template = next((template for template in templates if template["name"] == selected_template_name), None)
         if selected_template:
+            template_id = selected_template["id"]
+            # Bodies are only downloaded for the selected template
+            selected_template = fetch_template(selected_template["id"]) or selected_template
             default_subject = selected_template.get("subject", "")
             default_body = selected_template.get("body", "")
 
     # Subject and Body with editable fields
     subject = st.text_input("Email Subject", value=default_subject, key="subject")
-    body = st.text_area("Email Body", value=default_body, key="body")
+    body = st.text_area("Email Body", value=default_body, key="body", help="Use {{column}} to fill in a value from an extra CSV column, e.g. {{first_name}}")
 
     # CC and BCC fields
     cc = st.text_area("CC [Give Comma-Seperated Values] (Optional)", value="", key="cc")
     bcc = st.text_area("BCC [Give Comma-Seperated Values] (Optional)", value="", key="bcc")
 
     # File uploader for CSV
-    csv_file = st.file_uploader("Recipient Emails - Upload CSV file", type="csv")
+    csv_file = st.file_uploader("Recipient Emails - Upload CSV file", type=["csv", "gz"])
 
     # Select Date and Time (shown above the buttons)
     selected_date = st.date_input("Select Date (Optional)", value=pd.to_datetime("today").date(), key="date_option")
@@ -502,20 +549,28 @@ def send_mass_mail_interface():
                     "cc": cc,
                     "bcc": bcc
                 }
+                if extra_senders.strip():
+                    data["sender_pool"] = f"{email},{extra_senders}"
+                if template_id:
+                    data["template_id"] = template_id
 
                 # Make the API request to send the mail
-                response = requests.post(
+                response = api_session().post(
                     f"{API_URL}/send_mass_mail",
                     data=data,
                     files=files
                 )
 
-                if response.status_code == 200:
-                    st.success("Emails sent successfully!")
-                    time.sleep(1)
-                    st.rerun()  # Reload the page to show updated status
-                elif response.status_code == 202:
-                    st.success("Email Scheduled Successfully!")
+                if response.status_code == 202:
+                    # The send runs in the background; follow it through /campaigns/<id>
+                    result = response.json()
+                    st.session_state.campaign_id = result["campaign_id"]
+                    st.session_state.pop("campaign_progress", None)
+                    clear_dashboard_cache()
+                    if result.get("state") == "scheduled":
+                        st.success("Email Scheduled Successfully!")
+                    else:
+                        st.success("Sending started!")
                     time.sleep(1)
                     st.rerun()
                 elif response.status_code == 403:
@@ -527,14 +582,51 @@ def send_mass_mail_interface():
         else:
             st.warning("Please fill in all required fields.")
 
-    cred_gmails = fetch_verified_gmails()
-    cred_outlook = fetch_verified_outlook()
-    if not cred_gmails.empty:
-        st.subheader("Available Verified Gmails")
-        st.dataframe(cred_gmails)
-    if not cred_outlook.empty:
-        st.subheader("Available Verified Outlook Mails")
-        st.dataframe(cred_outlook)
+    show_last_campaign()
+    show_paged_table("Available Verified Gmails", "verified_gmails", fetch_verified_gmails)
+    show_paged_table("Available Verified Outlook Mails", "verified_outlook", fetch_verified_outlook)
+
+# Send History Interface
+def show_send_history_page():
+    st.title("Send History")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        status = st.selectbox("Status", ["All", "PENDING", "DELIVERED", "INBOXED", "SPAMMED", "FAILED", "THROTTLED", "UNKNOWN"], key="history_status")
+        sender = st.text_input("Sender Email", value="", key="history_sender")
+        since = st.date_input("From (Optional)", value=None, key="history_since")
+    with col2:
+        service = st.selectbox("Service", ["All", "gmail", "outlook"], key="history_service")
+        recipient = st.text_input("Recipient Starts With", value="", key="history_recipient")
+        until = st.date_input("Until (Optional)", value=None, key="history_until")
+
+    filters = {
+        "status": None if status == "All" else status,
+        "service": None if service == "All" else service,
+        "sender": sender or None,
+        "recipient": recipient or None,
+        "since": str(since) if since else None,
+        "until": str(until + pd.Timedelta(days=1)) if until else None  # Include the whole last day
+    }
+    # Changing a filter starts again from the first page
+    if st.session_state.get("history_filters") != filters:
+        st.session_state.history_filters = filters
+        st.session_state.history_cursors = [None]
+    cursors = st.session_state.history_cursors
+
+    try:
+        response = api_session().get(f"{API_URL}/email_status", params={**filters, "limit": PAGE_SIZE, "cursor": cursors[-1]})
+        if response.status_code == 200:
+            page = response.json()
+            if page["items"]:
+                st.dataframe(pd.DataFrame(page["items"]))
+                show_page_buttons("history", cursors, page["next_cursor"])
+            else:
+                st.info("No emails match these filters.")
+        else:
+            st.error(f"Failed to load send history: {response.text}")
+    except Exception as e:
+        st.error(f"Error loading data: {e}")
 
 # Sidebar Navigation
 def sidebar_navigation():
@@ -551,6 +643,9 @@ def sidebar_navigation():
     if st.sidebar.button("DashBoard"):
         st.session_state.active_page = "DashBoard"
         st.rerun()
+    if st.sidebar.button("Send History"):
+        st.session_state.active_page = "Send History"
+        st.rerun()
     if st.sidebar.button("Logout"):
         st.session_state.logged_in = False
         st.session_state.active_page = "Login"
@@ -578,4 +673,6 @@ if __name__ == "__main__":
     elif st.session_state.active_page == "Email Templates":
         email_templates_management()
     elif st.session_state.active_page == "DashBoard":
-        show_dashboard_page()
\ No newline at end of file
+        show_dashboard_page()
+    elif st.session_state.active_page == "Send History":
+        show_send_history_page()
\ No newline at end of file
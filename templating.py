@@ -0,0 +1,44 @@
+import re
+from functools import lru_cache
+
+# Merge fields look like {{first_name}}; names are matched case-insensitively against the CSV header
+FIELD_PATTERN = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# A template parsed once into a str.format pattern, so rendering a recipient is a single format call.
+# Each field is referred to by its position in self.fields rather than by name, so a name that str.format
+# would read as a positional index or an attribute, such as {{2024}}, still renders as a field.
+# Missing merge values render as an empty string; text without merge fields is returned as it is.
+class CompiledTemplate:
+    def __init__(self, text):
+        self.text = text or ""
+        self.fields = []
+        pattern = []
+        position = 0
+        for match in FIELD_PATTERN.finditer(self.text):
+            pattern.append(self._escape(self.text[position:match.start()]))
+            name = match.group(1).lower()
+            if name not in self.fields:
+                self.fields.append(name)
+            pattern.append("{" + str(self.fields.index(name)) + "}")
+            position = match.end()
+        pattern.append(self._escape(self.text[position:]))
+        self.pattern = "".join(pattern)
+
+    @staticmethod
+    def _escape(literal):
+        return literal.replace("{", "{{").replace("}", "}}")
+
+    def render(self, values=None):
+        if not self.fields:
+            return self.text
+        values = values or {}
+        return self.pattern.format(*[values.get(name, "") for name in self.fields])
+
+# Templates are compiled once per distinct text and shared by every send of a campaign
+@lru_cache(maxsize=256)
+def compile_template(text):
+    return CompiledTemplate(text)
+
+# Merge field name for a CSV header cell: "First Name" -> "first_name"
+def field_name(header):
+    return re.sub(r"\W+", "_", header.strip().lower()).strip("_")